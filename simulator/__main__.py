@@ -12,7 +12,10 @@
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
 import time
+from pathlib import Path
+import numpy as np
 from battery_simulator import Simulation
+from checkpoint import save_checkpoint, load_checkpoint
 from config.constants import (
     DEVICE_NAME,
     SIM_TIME,
@@ -23,21 +26,25 @@ from config.constants import (
     ENERGY_CHARGING,
     ENERGY_DISCHARGING,
 )
-import pandas as pd
 
 
 if __name__ == "__main__":
     print("--------------------------- Setting up simulation -------------------------------------")
     # read status file and try to find device
-    try:
-        sf = pd.read_csv("status/" + DEVICE_NAME + ".csv")
-        CYCLE_START = int(sf["cycle"].values[0])
-        TIMESTAMP_START = sf["timestamp"].values[0]
-        PARTIAL_CYCLE_CHARGING = float(sf["partial_charge"].values[0])
-        PARTIAL_CYCLE_DISCHARGING = float(sf["partial_discharge"].values[0])
-        ENERGY_CHARGING = float(sf["energy_charging"].values[0])
-        ENERGY_DISCHARGING = float(sf["energy_discharging"].values[0])
-    except:
+    status_file = Path("status") / (DEVICE_NAME + ".npz")
+    if status_file.exists():
+        try:
+            sf = np.load(status_file)
+            CYCLE_START = int(sf["cycle"])
+            # an empty timestamp marks a previous run that logged no rows; keep the constants default then
+            TIMESTAMP_START = str(sf["timestamp"]) or TIMESTAMP_START
+            PARTIAL_CYCLE_CHARGING = float(sf["partial_charge"])
+            PARTIAL_CYCLE_DISCHARGING = float(sf["partial_discharge"])
+            ENERGY_CHARGING = float(sf["energy_charging"])
+            ENERGY_DISCHARGING = float(sf["energy_discharging"])
+        except Exception:
+            print("Status file could not be read. It will be regenerated after simulation is finished!")
+    else:
         print("No status file found. It will be generated after simulation is finished!")
 
     # create simulation object managing the battery simulation
@@ -61,6 +68,12 @@ if __name__ == "__main__":
     # this adjustment originates from comparison to real world data of a Tesla Model S P85
     sim.bat.volt_min /= 0.7267
 
+    # restore the full component state from the checkpoint of the previous run if available, which skips replaying
+    # the degradation of already completed cycles
+    checkpoint_file = Path("status") / (DEVICE_NAME + "_checkpoint.npz")
+    if checkpoint_file.exists():
+        load_checkpoint(sim, str(checkpoint_file))
+
     # run simulation and get logging dict, measure and output time used for simulation
     print("---------------------------   Start  Simulation   -------------------------------------")
     toc = time.time()
@@ -69,15 +82,18 @@ if __name__ == "__main__":
 
     # save latest status of simulation for continuing in future
     print("Saving current state of simulation...")
-    data = {
-        "deviceId": [DEVICE_NAME],
-        "cycle": [sim.bat.cycle],
-        "timestamp": [sim.logger.timestamp_latest],
-        "partial_charge": [sim.partial_cycle_charging],
-        "partial_discharge": [sim.partial_cycle_discharging],
-        "energy_charging": [sim.bat.energy_charging],
-        "energy_discharging": [sim.bat.energy_discharging],
-    }
-    s_file = pd.DataFrame(data=data)
-    s_file.to_csv("status/" + DEVICE_NAME + ".csv")
+    np.savez(
+        status_file,
+        deviceId=DEVICE_NAME,
+        cycle=sim.bat.cycle,
+        # fall back to an empty string if the run logged no rows; savez would pickle None into an object array
+        # that the next run's np.load refuses to read back
+        timestamp=sim.logger.timestamp_latest or "",
+        partial_charge=sim.partial_cycle_charging,
+        partial_discharge=sim.partial_cycle_discharging,
+        energy_charging=sim.bat.energy_charging,
+        energy_discharging=sim.bat.energy_discharging,
+    )
+    # save the full component state for bulk restore on the next run
+    save_checkpoint(sim, str(checkpoint_file))
     print("Done")
@@ -11,12 +11,149 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
-from utils import add_noise
+import math
+
+from utils import add_noise, broadcast_attributes
 from typing import List
-from config.constants import DT
-from cell import Cell
+from config.constants import DT, DT_PER_HOUR, K_HA, T_ENV_SUM
+from cell import Cell, degrade_batch, CAPACITANCE_FACTOR, calc_state_of_charge_batch
 import numpy as np
 
+# global time step size bound as module-level float, so the step kernels work on a float local without re-coercion
+_DT = float(DT)
+_DT_PER_HOUR = float(DT_PER_HOUR)
+
+
+def _cc_cv_step(volt, volt_max, current, cap, capacitance, cv_decay, dt, constant_current):
+    """
+    Numeric core of one CC/CV charging step, kept free of attribute access so the hot loop runs on locals only.
+
+    :return: Updated voltage, current and capacity after one time step
+    :rtype: tuple
+    """
+
+    # constant current mode
+    if volt < volt_max:
+        current = constant_current
+        # Added capacity in Ah during time step, via the precomputed time step size in hours
+        cap += current * _DT_PER_HOUR
+        volt += current * dt / capacitance  # dU = dQ / C, voltage increment per time step
+    # constant voltage mode
+    else:
+        current *= cv_decay  # precomputed exp(-dt / (R * C)) decay factor
+        cap += current * _DT_PER_HOUR
+    return volt, current, cap
+
+
+def _soc_and_temperature_step(cap, cap_max, inv_cap_max_0, current, internal_resistance, temp, teff, tcap, weight, dt):
+    """
+    Shared tail of the fused step kernels: state of charge and temperature update after the electrical integration.
+
+    :return: State of charge values and temperature after one time step
+    :rtype: tuple
+    """
+
+    # state of charge from 0 to 1, see Cell.calc_state_of_charge; the original maximum capacity never changes after
+    # construction, so its cached inverse turns the division into a multiply
+    soc = cap * inv_cap_max_0
+    soc_normed = cap / cap_max
+
+    # temperature balance of electrical loss against the folded convection, passive and active cooling terms,
+    # see Cell.calc_temperature
+    d_power_loss = current**2 * internal_resistance  # P = U * I = R * I^2
+    d_power_balance = d_power_loss - K_HA * (4.0 * temp - T_ENV_SUM)
+    temp += d_power_balance * dt * teff / (tcap * weight)  # E = P * t
+
+    return soc, soc_normed, temp
+
+
+def _advance_charge_step(
+    volt,
+    volt_max,
+    current,
+    cap,
+    capacitance,
+    internal_resistance,
+    cv_decay,
+    cap_max,
+    inv_cap_max_0,
+    temp,
+    temp_efficiency_factor,
+    temp_capacity,
+    weight,
+    dt,
+    constant_current,
+):
+    """
+    Fused kernel advancing one full charging time step: CC/CV integration, state of charge and temperature update.
+    Combining the three updates into one function keeps all hot state in locals across the whole step instead of
+    re-reading battery attributes three times per time step.
+
+    :return: Updated voltage, current, capacity, state of charge values and temperature after one time step
+    :rtype: tuple
+    """
+
+    # CC/CV integration of voltage, current and capacity
+    volt, current, cap = _cc_cv_step(volt, volt_max, current, cap, capacitance, cv_decay, dt, constant_current)
+    soc, soc_normed, temp = _soc_and_temperature_step(
+        cap, cap_max, inv_cap_max_0, current, internal_resistance, temp, temp_efficiency_factor, temp_capacity, weight,
+        dt,
+    )
+    return volt, current, cap, soc, soc_normed, temp
+
+
+def _advance_drive_step(
+    volt,
+    volt_min,
+    volt_max,
+    current,
+    discharge_current_max,
+    discharge_volt_slope_lin,
+    discharge_volt_slope_nonlin,
+    cap,
+    capacitance,
+    internal_resistance,
+    cap_max,
+    inv_cap_max_0,
+    temp,
+    temp_efficiency_factor,
+    temp_capacity,
+    weight,
+    dt,
+    discharging,
+):
+    """
+    Fused kernel advancing one full driving time step: voltage law, capacity integration, state of charge and
+    temperature update. During discharging the voltage follows the piecewise discharge profile, during recuperation
+    charging it rises by dU = dQ / C. As with _advance_charge_step, keeping the whole step in one function avoids
+    re-reading battery attributes between the sub-updates.
+
+    :return: Updated voltage, capacity, state of charge values and temperature after one time step
+    :rtype: tuple
+    """
+
+    if discharging:
+        # discharge voltage from capacity and current, see Cell.discharge_profile
+        soc = cap * inv_cap_max_0
+        doc = 1 - soc
+        volt_offset = 0.5 * current / discharge_current_max
+        nonlin = doc > 0.9
+        volt = nonlin * (discharge_volt_slope_nonlin * soc * 10 + volt_offset + volt_min) + (1.0 - nonlin) * (
+            -discharge_volt_slope_lin * doc + volt_offset + volt_max
+        )
+        # subtracted (current is negative) capacity in Ah during time step
+        cap += current * _DT_PER_HOUR
+    else:
+        # added capacity in Ah during time step, via the precomputed time step size in hours
+        cap += current * _DT_PER_HOUR
+        volt += current * dt / capacitance  # dU = dQ / C, voltage increment per time step
+
+    soc, soc_normed, temp = _soc_and_temperature_step(
+        cap, cap_max, inv_cap_max_0, current, internal_resistance, temp, temp_efficiency_factor, temp_capacity, weight,
+        dt,
+    )
+    return volt, cap, soc, soc_normed, temp
+
 
 class Battery(Cell):
     """
@@ -51,6 +188,9 @@ class Battery(Cell):
         self.config_num_s = int(self.config.split("S")[0])
         # ToDo: Something like "16S" should also be acceptable (without providing the second part)
         self.config_num_p = int(self.config.split("S")[1].split("P")[0])
+        # cached inverse wiring factors, reused in the hot propagation paths instead of dividing per stack
+        self._inv_s = 1.0 / self.config_num_s
+        self._inv_p = 1.0 / self.config_num_p
         # initialize cell objects, using standard parameter
         self.stacks = stack_list
 
@@ -62,6 +202,12 @@ class Battery(Cell):
         self.energy_charging = 0
         self.energy_discharging = 0
 
+        # cached inverse of the original maximum capacity, set once the battery properties are aggregated
+        self._inv_cap_max_0 = 0.0
+        # cached exp(-DT / (R * C)) decay factor for the CV charging branch, recomputed only when R or C change
+        self._cv_decay = 0.0
+        self._cv_decay_key = None
+
         # temp characteristics
         self.temp_efficiency_factor = self.stacks[0].temp_efficiency_factor
         self.temp_capacity = self.stacks[0].temp_capacity
@@ -69,60 +215,53 @@ class Battery(Cell):
     def calc_bat_prop(self):
         """
         Calculates the electrical properties of battery as the combination of wired stacks, depending on config.
+        The scalar accumulator loops are replaced by NumPy reductions over arrays of shape (num_s, num_p), which keeps
+        the aggregation at C level even for batteries composed of many stacks.
         """
 
-        c = 0  # counter for selecting stack
-        for s in range(self.config_num_s):
-            # initialize battery module properties
-            bat_voltage = 0
-            bat_capacity = 0
-            bat_capacity_max = 0
-            bat_weight = 0
-            bat_voltage_min = 0
-            bat_voltage_max = 0
-            bat_current = 0
-            bat_discharge_current_max = 0
-            bat_internal_resistance = 0
-            bat_discharge_voltage_slope_lin = 0
-            bat_discharge_voltage_slope_nonlin = 0
-            bat_temperature = 0
-            p = 0  # counter variable for number of parallely wired stacks
-            # set parameter values according to joined stacks
-            while p < self.config_num_p:
-                stack = self.stacks[c]  # select stack from list
-                stack.tag = "s" + str(s) + "_p" + str(p)  # tag stack name to retrace components in wiring
-                bat_voltage += stack.volt
-                bat_voltage_min += stack.volt_min
-                bat_voltage_max += stack.volt_max
-                bat_discharge_voltage_slope_lin += stack.discharge_volt_slope_lin
-                bat_discharge_voltage_slope_nonlin += stack.discharge_volt_slope_nonlin
-                bat_internal_resistance += stack.internal_resistance
-                bat_current += stack.current
-                bat_discharge_current_max += stack.discharge_current_max
-                bat_capacity += stack.cap
-                bat_capacity_max += stack.cap_max
-                bat_weight += stack.weight
-                bat_temperature += stack.temp
-                p += 1
-                c += 1
-            # add mean (division by p) to parameter, if it is not affected by parallel wiring
-            self.volt += bat_voltage / p
-            self.volt_min += bat_voltage_min / p
-            self.volt_max += bat_voltage_max / p
-            self.discharge_volt_slope_lin += bat_discharge_voltage_slope_lin / p
-            self.discharge_volt_slope_nonlin += bat_discharge_voltage_slope_nonlin / p
-            self.internal_resistance += bat_internal_resistance / p
-            self.temp += bat_temperature / p
-            self.weight += bat_weight
-        self.current += bat_current
-        self.discharge_current_max += bat_discharge_current_max
-        self.cap += bat_capacity
-        self.cap_max += bat_capacity_max
-        self.temp /= s + 1
-        self.internal_resistance /= s + 1  # scale parameter according to number of serially wired stacks
+        num_s = self.config_num_s
+        num_p = self.config_num_p
+        stacks = self.stacks[: num_s * num_p]
+        # tag stack names to retrace components in wiring
+        for idx, stack in enumerate(stacks):
+            stack.tag = (idx // num_p, idx % num_p)
+
+        # parameter not affected by parallel wiring: mean over parallel stacks, summed over serial blocks
+        atts_mean = [
+            "volt",
+            "volt_min",
+            "volt_max",
+            "discharge_volt_slope_lin",
+            "discharge_volt_slope_nonlin",
+            "internal_resistance",
+            "temp",
+        ]
+        # additive parameter for parallel wiring, determined by one serial block
+        atts_add = ["current", "discharge_current_max", "cap", "cap_max"]
+
+        # collect all stack attributes in one traversal as array of shape (num_s, num_p, num_attributes); fromiter
+        # fills the contiguous buffer directly instead of building nested Python lists first
+        atts = atts_mean + atts_add + ["weight"]
+        blocks = np.fromiter(
+            (stack.__dict__[att] for stack in stacks for att in atts), dtype=float, count=len(stacks) * len(atts)
+        ).reshape(num_s, num_p, len(atts))
+
+        # one partial reduction per series block, fused over all mean-type attributes at once
+        mean_sums = blocks[:, :, : len(atts_mean)].mean(axis=1).sum(axis=0)
+        for att, value in zip(atts_mean, mean_sums):
+            self.__dict__[att] += value
+        # additive attributes reduced over the parallel stacks of the last series block
+        add_sums = blocks[-1, :, len(atts_mean) : -1].sum(axis=0)
+        for att, value in zip(atts_add, add_sums):
+            self.__dict__[att] += value
+        self.weight += blocks[:, :, -1].sum()
+        self.temp /= num_s
+        self.internal_resistance /= num_s  # scale parameter according to number of serially wired stacks
         # calculate stack maximum energy, weight and capacitance independently of configuration
-        self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.67  # cell capacitance [F]
+        self.capacitance = self.cap_max * CAPACITANCE_FACTOR / self.volt_max  # cell capacitance [F]
         self.cap_max_0 = self.cap_max
+        # cached inverse of the original maximum capacity, turning the per-step state of charge into a multiply
+        self._inv_cap_max_0 = 1.0 / self.cap_max_0
         # set stack cycle attributes to value of last cell in list ToDo: What if stack is composed of some older cells?
         # self.cycle = stack.cycle
         # self.cycle_pre = stack.cycle_pre
@@ -140,33 +279,49 @@ class Battery(Cell):
         if attributes is None:
             attributes = []
         if electric:
-            # apply wiring logic to electrical parameter
+            # compute wiring logic for electrical parameter once with the cached inverse factors, then assign the
+            # shared values to all stacks in one bulk store per stack
+            broadcast_attributes(
+                self.stacks,
+                {
+                    "current": self.current * self._inv_p,
+                    "discharge_current_max": self.discharge_current_max * self._inv_p,
+                    "cap": self.cap * self._inv_p,
+                    "cap_max": self.cap_max * self._inv_p,
+                    "volt": self.volt * self._inv_s,
+                    "volt_min": self.volt_min * self._inv_s,
+                    "volt_max": self.volt_max * self._inv_s,
+                    "discharge_voltage_slope_lin": self.discharge_volt_slope_lin * self._inv_s,
+                    "discharge_voltage_slope_nonlin": self.discharge_volt_slope_nonlin * self._inv_s,
+                    "weight": self.weight * self._inv_s * self._inv_p,
+                    "temp": self.temp,
+                },
+            )
+            self.capacitance = self.cap_max * CAPACITANCE_FACTOR / self.volt_max  # cell capacitance [F]
+            calc_state_of_charge_batch(self.stacks)
             for stack in self.stacks:
-                stack.current = self.current / self.config_num_p
-                stack.discharge_current_max = self.discharge_current_max / self.config_num_p
-                stack.cap = self.cap / self.config_num_p
-                stack.cap_max = self.cap_max / self.config_num_p
-
-                stack.volt = self.volt / self.config_num_s
-                stack.volt_min = self.volt_min / self.config_num_s
-                stack.volt_max = self.volt_max / self.config_num_s
-                stack.discharge_voltage_slope_lin = self.discharge_volt_slope_lin / self.config_num_s
-                stack.discharge_voltage_slope_nonlin = self.discharge_volt_slope_nonlin / self.config_num_s
-
-                stack.weight = self.weight / (self.config_num_s * self.config_num_p)
-                stack.temp = self.temp
-
-                self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.67  # cell capacitance [F]
-                stack.calc_state_of_charge()
                 stack.propagate_attributes(electric=True)
             add_noise(["volt", "cap", "temp", "weight"], self.stacks)
         else:
-            # non electrical parameter
-            for att in list(attributes):
-                bat_att = self.__dict__[att]
-                for s in self.stacks:
-                    s.__dict__[att] = bat_att
-                    s.propagate_attributes([att])
+            # non electrical parameter, assigned to all stacks in one bulk store per stack, then pushed further down
+            # to the cells with a single recursive call per stack instead of one per attribute
+            broadcast_attributes(self.stacks, {att: self.__dict__[att] for att in attributes})
+            for s in self.stacks:
+                s.propagate_attributes(attributes)
+
+    def set_mode(self, mode: str):
+        """
+        Sets the battery mode and propagates it to all stacks and cells, but only when the mode actually changes.
+        The mode is constant within a simulation phase, so the per-step callers can use this unconditionally without
+        paying the full component walk on every time step.
+
+        :param mode: New battery mode, "charge", "discharge" or "pause"
+        :type mode: str
+        """
+
+        if mode != self.mode:
+            self.mode = mode
+            self.propagate_attributes(["mode"])
 
     def increment_cycle(self, increment: int = 1):
         """
@@ -180,11 +335,9 @@ class Battery(Cell):
         self.cycle_pre += increment
         self.propagate_attributes(["cycle", "cycle_pre"])
         self.degrade()  # degrade battery due to cycle increment
-        # degrade stacks and cells of battery caused by cycle increment
-        for stack in self.stacks:
-            stack.degrade()
-            for cell in stack.cells:
-                cell.degrade()
+        # degrade all stacks and cells of battery caused by cycle increment in one vectorized batch each
+        degrade_batch(self.stacks)
+        degrade_batch([cell for stack in self.stacks for cell in stack.cells])
 
     def load_battery_step(self, constant_current: float = 1.625):
         """Carries out one step of the battery charging process.
@@ -193,26 +346,69 @@ class Battery(Cell):
         :type constant_current: float
         """
 
-        # constant current mode
-        if self.volt < self.volt_max:
-            self.current = constant_current
-            # charge provided from constant current during time step
-            charge_per_timestep = self.current * DT
-            # Added capacity in Ah during time step
-            self.cap += charge_per_timestep / 60**2
+        # advance voltage, current, capacity, state of charge and temperature in one fused step
+        self.volt, self.current, self.cap, self.soc, self.soc_normed, self.temp = _advance_charge_step(
+            self.volt,
+            self.volt_max,
+            self.current,
+            self.cap,
+            self.capacitance,
+            self.internal_resistance,
+            self._cv_decay_factor(),
+            self.cap_max,
+            self._inv_cap_max_0,
+            self.temp,
+            self.temp_efficiency_factor,
+            self.temp_capacity,
+            self.weight,
+            _DT,
+            constant_current,
+        )
+        self.current_max = max(self.current_max, self.current)
 
-            dU = charge_per_timestep / self.capacitance  # dU = dQ / C, voltage increment per time step
+    def drive_battery_step(self, current: float, discharging: bool = True):
+        """Carries out one step of the battery driving process (discharging or recuperation charging).
 
-            self.volt += dU
+        :param current: Battery current [C value], scaled by the original maximum capacity to the current in [A]
+        :type current: float
+        :param discharging: Indicates discharging (True) or recuperation charging (False) voltage behavior
+        :type discharging: bool
+        """
 
-            self.current_max = max(self.current_max, self.current)
-        # constant voltage mode
-        else:
-            self.current *= np.exp(-DT / (self.internal_resistance * self.capacitance))
-
-            self.cap += self.current * DT / 60**2
-            self.current_max = max(self.current_max, self.current)
-        # update battery state of charge
-        self.calc_state_of_charge()
-        # calc cell temp
-        self.calc_temperature()
+        self.current = current * self.cap_max_0
+        # advance voltage, capacity, state of charge and temperature in one fused step
+        self.volt, self.cap, self.soc, self.soc_normed, self.temp = _advance_drive_step(
+            self.volt,
+            self.volt_min,
+            self.volt_max,
+            self.current,
+            self.discharge_current_max,
+            self.discharge_volt_slope_lin,
+            self.discharge_volt_slope_nonlin,
+            self.cap,
+            self.capacitance,
+            self.internal_resistance,
+            self.cap_max,
+            self._inv_cap_max_0,
+            self.temp,
+            self.temp_efficiency_factor,
+            self.temp_capacity,
+            self.weight,
+            _DT,
+            discharging,
+        )
+
+    def _cv_decay_factor(self) -> float:
+        """
+        Returns the exp(-DT / (R * C)) decay factor of the CV charging branch. The transcendental is only evaluated
+        when internal resistance or capacitance have changed (e.g. through degradation) instead of every time step.
+
+        :return: Decay factor of the charging current in constant voltage mode
+        :rtype: float
+        """
+
+        key = (self.internal_resistance, self.capacitance)
+        if key != self._cv_decay_key:
+            self._cv_decay = math.exp(-_DT / (self.internal_resistance * self.capacitance))
+            self._cv_decay_key = key
+        return self._cv_decay
@@ -11,13 +11,14 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
+import os
 from typing import List, Dict, Generator
 
 import numpy as np
 import pandas as pd
 
 from config.constants import *
-from cell import Cell
+from cell import Cell, degradation_start_batch
 from stack import Stack
 from battery import Battery
 from utils import add_noise, rand
@@ -83,8 +84,13 @@ class Simulation:
         """
 
         if isinstance(prop, dict):
+            bat_dict = self.bat.__dict__
             for key in prop:
-                self.bat.__dict__[key] = prop[key]
+                # only existing attributes may be set, which catches typos that would otherwise create new,
+                # silently unused attributes on the battery
+                if key not in bat_dict:
+                    raise AttributeError("Battery has no attribute '{}'".format(key))
+                bat_dict[key] = prop[key]
         else:
             raise AssertionError(
                 "PROP must be a dict containing key and value pairs, e.g. {'voltage': X, 'capacity': Y}"
@@ -129,9 +135,9 @@ class Simulation:
             cells.append(cell)
         # add small noise to some parameter
         add_noise(["volt", "cap", "temp", "weight"], cells)
+        # apply degradation of cells for cycle_start > 0, batched over the whole cell population
+        degradation_start_batch(cells)
         for idx, cell in enumerate(cells):
-            # apply degradation of cells for cycle_start > 0
-            # cell.degradation_start()  ToDo: Reactivate
             # set cells name
             cell.name = "cell" + str(idx)
 
@@ -142,11 +148,11 @@ class Simulation:
             stack = Stack(cell_list=cells[num_cells_per_stack * i : num_cells_per_stack * (1 + i)], config=config_stack)
             # calc stack properties according to cells used
             stack.calc_stack_prop()
-            # apply degradation of stacks for cycle_start > 0
-            # stack.degradation_start()  ToDo: Reactivate
             # set stacks name
             stack.name = "stack" + str(i)
             stacks.append(stack)
+        # apply degradation of stacks for cycle_start > 0, batched over all stacks
+        degradation_start_batch(stacks)
 
         # initialize battery object
         bat = Battery(config=config_bat, stack_list=stacks, cycle_start=self.cycle_start)
@@ -180,20 +186,33 @@ class Simulation:
         self.bat.volt = self.bat.volt_min + self.bat.soc / 0.8 * (self.bat.volt_max - self.bat.volt_min)
 
         self.bat.calc_state_of_charge()
-        self.bat.mode = "charge"
-        self.bat.propagate_attributes(["mode"])
+        self.bat.set_mode("charge")
         self.bat.current_min = 0
         # termination criterion: charging current < X mA && capacity >= capacity_max
         charging_stop_rand = rand.triangular(left=0.6, mode=CHARGING_STOP, right=0.98)  # random stop in sensible range
-        while (self.bat.current > charging_stop) and (self.bat.cap <= self.bat.cap_max * charging_stop_rand):
-            bat_soc = self.bat.soc  # "old" soc for calculation of cumulative battery cycle
-            self.bat.load_battery_step(constant_current=constant_current)
-            self.t += 1
+        # bind hot attributes to locals, keeping method lookups out of the step loop
+        bat = self.bat
+        load_battery_step = bat.load_battery_step
+        log = self.logger.log
+        # hoist the loop invariants: the capacity stop bound is fixed for the whole charging phase (the capacity
+        # maximum only degrades at cycle increments outside this loop), so it is computed once instead of per step;
+        # the cycle accumulator and time live in locals and are written back after the loop
+        cap_stop = bat.cap_max * charging_stop_rand
+        t = self.t
+        partial_cycle_charging = self.partial_cycle_charging
+        log_freq = self.logger.log_freq
+        while (bat.current > charging_stop) and (bat.cap <= cap_stop):
+            bat_soc = bat.soc  # "old" soc for calculation of cumulative battery cycle
+            load_battery_step(constant_current=constant_current)
+            t += 1
             # add incremental soc and energy for cumulative battery cycle
-            self.partial_cycle_charging += self.bat.soc - bat_soc
-            self.bat.energy_charging += self.bat.volt * self.bat.current * DT
-            # log parameter every LOGGING_FREQ steps
-            self.logger.log(time=self.t)
+            partial_cycle_charging += bat.soc - bat_soc
+            bat.energy_charging += bat.volt * bat.current * DT
+            # log parameter, skipping the steps at which the logger would not act anyway
+            if t % log_freq == 0:
+                log(time=t)
+        self.t = t
+        self.partial_cycle_charging = partial_cycle_charging
         # set battery current to zero after charging
         self.bat.current = 0.0
 
@@ -204,31 +223,22 @@ class Simulation:
         :type current: float
         """
 
-        self.bat.calc_state_of_charge()
-        self.bat.mode = "discharge"
-        self.bat.propagate_attributes(["mode"])
-        # "old" soc for calculation of cumulative battery cycle
+        self.bat.set_mode("discharge")
+        # "old" soc for calculation of cumulative battery cycle; the state of charge is kept current by every step
+        # kernel and by the starting condition in simulate, so it is not recomputed on entry
         bat_soc = self.bat.soc
 
-        self.bat.current = current * self.bat.cap_max_0
-        # calculate battery discharge profile (voltage) based on capacity and current
-        self.bat.discharge_profile()
-        # charge provided from current during time step
-        charge_per_timestep = self.bat.current * DT
-        # Subtracted (current is negative) capacity in Ah during time step
-        self.bat.cap += charge_per_timestep / 60**2
-
-        # update battery state of charge
-        self.bat.calc_state_of_charge()
-        # calc cell temp
-        self.bat.calc_temperature()
+        # advance voltage, capacity, state of charge and temperature in one fused step
+        self.bat.drive_battery_step(current=current, discharging=True)
 
         self.t += 1
         # add incremental soc and energy for cumulative battery cycle
         self.partial_cycle_discharging += bat_soc - self.bat.soc
-        self.bat.energy_discharging += self.bat.volt * abs(self.bat.current) * DT
-        # log parameter every LOGGING_FREQ steps
-        self.logger.log(time=self.t)
+        # the discharging current is never positive, so the sign flip replaces the per-step abs() call
+        self.bat.energy_discharging += self.bat.volt * -self.bat.current * DT
+        # log parameter, skipping the steps at which the logger would not act anyway
+        if self.t % self.logger.log_freq == 0:
+            self.logger.log(time=self.t)
 
     def pause(self, time: float = 3 * 60):
         """
@@ -240,19 +250,34 @@ class Simulation:
 
         # counter for time in pause mode
         t_pause = 0
-        self.bat.mode = "pause"
-        self.bat.propagate_attributes(["mode"])
+        self.bat.set_mode("pause")
 
         self.bat.current_min = 0
         self.bat.current_max = 0
-        while t_pause < (time / DT):
-            # calc cell temp
-            self.bat.calc_temperature()
+        # bind hot attributes to locals, keeping method lookups out of the step loop
+        steps = time / DT
+        bat = self.bat
+        log = self.logger.log
+        t = self.t
+        # the pause phase only evolves the temperature recurrence: the current is constant, so the power loss and
+        # the thermal mass are loop invariants and the recurrence runs purely on locals; the temperature is written
+        # back each step so the logger reads the live value
+        temp = bat.temp
+        d_power_loss = bat.current**2 * bat.internal_resistance  # P = U * I = R * I^2
+        teff = bat.temp_efficiency_factor
+        thermal_mass = bat.temp_capacity * bat.weight
+        log_freq = self.logger.log_freq
+        while t_pause < steps:
+            # temperature balance with folded convection terms, see Cell.calc_temperature
+            temp += (d_power_loss - K_HA * (4.0 * temp - T_ENV_SUM)) * DT * teff / thermal_mass  # E = P * t
+            bat.temp = temp
             # increment time
-            self.t += 1
+            t += 1
             t_pause += 1
-            # log parameter every LOGGING_FREQ steps
-            self.logger.log(time=self.t)
+            # log parameter, skipping the steps at which the logger would not act anyway
+            if t % log_freq == 0:
+                log(time=t)
+        self.t = t
 
     def charge_battery_step(self, current: float):
         """Carries out one step of the battery charging process.
@@ -261,32 +286,21 @@ class Simulation:
         :type current: float
         """
 
-        self.bat.calc_state_of_charge()
-        self.bat.mode = "charge"
-        self.bat.propagate_attributes(["mode"])
-        # "old" soc for calculation of cumulative battery cycle
+        self.bat.set_mode("charge")
+        # "old" soc for calculation of cumulative battery cycle; the state of charge is kept current by every step
+        # kernel and by the starting condition in simulate, so it is not recomputed on entry
         bat_soc = self.bat.soc
 
-        self.bat.current = current * self.bat.cap_max_0
-        # charge provided from constant current during time step
-        charge_per_timestep = self.bat.current * DT
-        # Added capacity in Ah during time step
-        self.bat.cap += charge_per_timestep / 60**2
-
-        dU = charge_per_timestep / self.bat.capacitance  # dU = dQ / C, voltage increment per time step
-
-        self.bat.volt += dU
-        # update battery state of charge
-        self.bat.calc_state_of_charge()
-        # calc cell temp
-        self.bat.calc_temperature()
+        # advance voltage, capacity, state of charge and temperature in one fused step
+        self.bat.drive_battery_step(current=current, discharging=False)
 
         self.t += 1
         # add incremental soc and energy for cumulative battery cycle
         self.partial_cycle_charging += self.bat.soc - bat_soc
         self.bat.energy_charging += self.bat.volt * self.bat.current * DT
-        # log parameter every LOGGING_FREQ steps
-        self.logger.log(time=self.t)
+        # log parameter, skipping the steps at which the logger would not act anyway
+        if self.t % self.logger.log_freq == 0:
+            self.logger.log(time=self.t)
 
     def simulate(
         self, sim_time: int, discharge_stop: float = DISCHARGE_STOP, charge_stop: float = CHARGING_STOP
@@ -311,7 +325,7 @@ class Simulation:
         self.bat.calc_state_of_charge()
         self.bat.current = 0  # start parking
         # set parameter of Logger, depending on hyperparameter and simulation obj
-        self.logger.prepare_logger_setup(timestamp_start=self.timestamp_start)
+        self.logger.prepare_logger_setup(timestamp_start=self.timestamp_start, sim_time=sim_time)
         # setup generator yielding current for dynamic driving behavior
         args = (
             ["simulator/driving_protocols/wltp_class" + str(WLTP_CLASS) + ".csv"]
@@ -341,9 +355,8 @@ class Simulation:
             self.pause(time=rand.uniform(low=2 * 60**2, high=8 * 60**2))
             # print("Run done.")
 
-        # save history to parquet file if wanted
-        if self.logger.parquet:
-            self.logger.log_parquet(self.logger.hist)
+        # write the end-of-run file outputs (remaining parquet block, feather dump) if wanted
+        self.logger.finalize_logs()
         # return dict containing the progress of desired parameter during simulation
         return self.logger.hist
 
@@ -361,19 +374,26 @@ class Simulation:
         # ToDo: maybe gauss would be better? But it would have to be limited to the left side!
         discharge_stop = rand.triangular(left=0.05, mode=discharge_stop_mean, right=0.6)
 
-        while self.bat.soc > discharge_stop:
+        # bind hot attributes to locals, keeping method lookups out of the step loop
+        bat = self.bat
+        cap_max_0 = bat.cap_max_0
+        discharge_battery_step = self.discharge_battery_step
+        charge_battery_step = self.charge_battery_step
+        while bat.soc > discharge_stop:
             current = next(generator)
             if current <= 0.0:
-                self.discharge_battery_step(current=current)
-                self.bat.current_min = min(self.bat.current, current * self.bat.cap_max_0)
+                discharge_battery_step(current=current)
+                bat.current_min = min(bat.current, current * cap_max_0)
             else:
-                self.charge_battery_step(current=current)
-                self.bat.current_max = max(self.bat.current, current * self.bat.cap_max_0)
+                charge_battery_step(current=current)
+                bat.current_max = max(bat.current, current * cap_max_0)
 
         # set discharging current to 0 after discharging completed
         self.bat.current = 0.0
+        # signal the generator to stop at its next lap/block boundary and release it; select_generator re-arms the
+        # flag when the next discharge phase requests a fresh generator
         self.discharge_profile.keep_sending = False
-        next(generator)
+        generator.close()
 
     def check_increment_cycle(self):
         """
@@ -399,17 +419,24 @@ class Simulation:
         """
 
         # ToDo: Include possibility to merge multiple plots into one fig or plot
+        import matplotlib
+
+        # select the non-interactive Agg backend before pyplot is imported, so headless batch runs neither pay for
+        # nor block on a GUI toolkit import; force=False respects a backend the caller already selected
+        matplotlib.use("Agg", force=False)
         import matplotlib.pyplot as plt
 
         if parameters is None:
             parameters = [""]
 
+        # the hist property materializes the dict of channel views on every access, so fetch it once for all plots
+        hist = self.logger.hist
         for key in parameters:
             hist_key = part + "_" + key
-            if hist_key in self.logger.hist.keys():
+            if hist_key in hist:
                 plt.figure()
-                plt.plot(self.logger.hist[hist_key])
+                plt.plot(hist[hist_key])
                 plt.title(hist_key)
                 plt.xlabel("Time [counts]")
                 plt.ylabel(key)
-                plt.savefig(LOGGING_DIR + hist_key + ".png")
+                plt.savefig(os.path.join(LOGGING_DIR, hist_key + ".png"))
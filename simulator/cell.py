@@ -12,15 +12,88 @@
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
 import json
-from config.constants import (
-    DT,
-    AMBIENT_TEMPERATURE,
-    BAT_AREA,
-    HEAT_TRANS_CONST,
-    BMS_INLETPASSIVETARGET,
-    BMS_INLETACTIVECOOLTARGET,
-    BMS_INLETACTIVEHEATTARGET,
-)
+from typing import List
+
+import numpy as np
+
+from utils import gather_attributes, scatter_attributes
+from config.constants import DT, K_HA, T_ENV_SUM
+
+# precomputed factor of the capacitance formula C = cap_max * 60**2 / volt_max * 4.67, folded into one constant
+CAPACITANCE_FACTOR = 60**2 * 4.67
+
+
+def degrade_batch(components: List, decrease_per_cycle: float = 0.05 / 140):
+    """
+    Applies the capacity degradation of Cell.degrade to a whole population of components (cells or stacks) at once.
+    The per-object method calls are replaced by vectorized NumPy operations over gathered attribute arrays, so the
+    battery-wide degradation becomes a handful of array multiplies instead of thousands of Python method dispatches.
+
+    :param components: Components (Cell, Stack) to be degraded together
+    :type components: list
+    :param decrease_per_cycle: Amount of decline of capacity per cycle
+    :type decrease_per_cycle: float
+    """
+
+    soa = gather_attributes(components, ["cycle", "cycle_pre", "cap_max", "volt", "volt_max", "current"])
+
+    # factor for degradation, used if cycle_start > 0
+    deg_factor = np.abs(soa["cycle"] - soa["cycle_pre"])
+    cap_max = soa["cap_max"] * (1 - decrease_per_cycle * deg_factor)
+
+    # calc dynamic properties again
+    power = soa["volt"] * soa["current"]  # nominal power [W]
+    energy = power * DT  # nominal energy during time step [Ws]
+    capacitance = cap_max * CAPACITANCE_FACTOR / soa["volt_max"]  # capacitance [F]
+
+    scatter_attributes(components, {"cap_max": cap_max, "power": power, "energy": energy, "capacitance": capacitance})
+
+
+def degradation_start_batch(components: List):
+    """
+    Applies the initial degradation of Cell.degradation_start to a whole population of components (cells or stacks)
+    at once. Components whose cycle counters indicate a worn start (cycle_start > 0) are degraded with one set of
+    vectorized array operations; fresh components are left untouched by blending with the selection mask.
+
+    :param components: Components (Cell, Stack) whose initial degradation should be applied together
+    :type components: list
+    """
+
+    atts = ["cycle", "cycle_pre", "cap_max", "volt", "volt_max", "current", "power", "energy", "capacitance"]
+    soa = gather_attributes(components, atts)
+
+    # factor for degradation, used if cycle_start > 0; only components with a cycle gap > 1 are degraded, all others
+    # keep their gathered values unchanged so the batch stays a no-op for fresh components
+    deg_factor = np.abs(soa["cycle"] - soa["cycle_pre"])
+    worn = deg_factor > 1
+    decrease_per_cycle = 0.05 / 140
+    cap_max = np.where(worn, soa["cap_max"] * (1 - decrease_per_cycle * deg_factor), soa["cap_max"])
+
+    # calc dynamic properties again
+    power = np.where(worn, soa["volt"] * soa["current"], soa["power"])  # nominal power [W]
+    energy = np.where(worn, power * DT, soa["energy"])  # nominal energy during time step [Ws]
+    capacitance = np.where(worn, cap_max * CAPACITANCE_FACTOR / soa["volt_max"], soa["capacitance"])  # capacitance [F]
+    # set cycle_pre accordingly, so the following regular degradation steps see a gap of one cycle
+    cycle_pre = np.where(worn, soa["cycle"] - 1, soa["cycle_pre"]).astype(int)
+
+    scatter_attributes(
+        components,
+        {"cap_max": cap_max, "power": power, "energy": energy, "capacitance": capacitance, "cycle_pre": cycle_pre},
+    )
+
+
+def calc_state_of_charge_batch(components: List):
+    """
+    Applies Cell.calc_state_of_charge to a whole population of components (cells or stacks) at once. The per-object
+    method calls of the propagation path are replaced by two vectorized divisions over gathered attribute arrays.
+
+    :param components: Components (Cell, Stack) whose state of charge should be recalculated together
+    :type components: list
+    """
+
+    soa = gather_attributes(components, ["cap", "cap_max", "cap_max_0"])
+    # state of charge from 0 to 1 and normed to the currently available capacity, see Cell.calc_state_of_charge
+    scatter_attributes(components, {"soc": soa["cap"] / soa["cap_max_0"], "soc_normed": soa["cap"] / soa["cap_max"]})
 
 
 class Cell:
@@ -28,6 +101,9 @@ class Cell:
     A class for definition of a single battery cell, which is stacked either serially or parallely.
     """
 
+    # cache of parsed config files, so the thousands of cells built from the same file share a single open and parse
+    _config_cache = {}
+
     def __init__(self):
         """
         Initialization of the class Cell serving as the base class for electrical components and containing all relevant
@@ -62,10 +138,22 @@ class Cell:
         self.cycle_pre = 0  # previous cycle number, used for simulations of worn cells with cycle_init > 0
         self.name = ""  # name of object, eg. "cell1", "stack_xyz", "bat_a"
         self.mode = ""  # current mode can be "discharge" or "charge"
-        self.tag = ""  # tag for retracing components in wiring
+        self.tag = ()  # (serial, parallel) index tag for retracing components in wiring, formatted via tag_str
         self.temp_efficiency_factor = 0  # efficiency factor for electrical energy <-> temperature conversion
         self.temp_capacity = 0  # specific temperature capacity for Li-Ion material
 
+    @property
+    def tag_str(self) -> str:
+        """
+        Wiring tag formatted as "s<serial>_p<parallel>", built on demand from the index tuple so the aggregation
+        paths only store two small ints per component instead of formatting strings.
+
+        :return: Formatted wiring tag, empty if the component has not been wired yet.
+        :rtype: str
+        """
+
+        return "s" + str(self.tag[0]) + "_p" + str(self.tag[1]) if self.tag else ""
+
     def set_config(self, cycle_start: int = 0, filename: str = "simulator/config/cell.json"):
         """
         Function for setting cell properties to default Panasonic NCR18650B (see data sources).
@@ -82,20 +170,23 @@ class Cell:
         """
 
         # ToDo: Method needs to be adjusted to work with many cells provided in config file!
-        with open(filename) as file:
-            data = json.load(file)
-            # number of current charging/discharging cycle (0 for simulation of new components)
-            self.cycle = cycle_start
-            # self.cycle_pre = cycle_start - 1
-            # name of component, e.g. "cell1". This is only valid for one cell.
-            self.name = list(data.keys())[0]
-            data_cell = data[self.name]
-            for key, value in data_cell.items():
-                self.__dict__[key] = value
-
-            self.power = self.volt * self.current  # Cell nominal power [W]
-            self.energy = self.power * DT  # Cell nominal energy during time step [Ws]
-            self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.6  # cell capacitance [F]
+        data = self._config_cache.get(filename)
+        if data is None:
+            with open(filename) as file:
+                data = json.load(file)
+            self._config_cache[filename] = data
+        # number of current charging/discharging cycle (0 for simulation of new components)
+        self.cycle = cycle_start
+        # self.cycle_pre = cycle_start - 1
+        # name of component, e.g. "cell1". This is only valid for one cell.
+        self.name = list(data.keys())[0]
+        data_cell = data[self.name]
+        for key, value in data_cell.items():
+            self.__dict__[key] = value
+
+        self.power = self.volt * self.current  # Cell nominal power [W]
+        self.energy = self.power * DT  # Cell nominal energy during time step [Ws]
+        self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.6  # cell capacitance [F]
 
     def calc_state_of_charge(self):
         """
@@ -116,21 +207,19 @@ class Cell:
         # ToDo: Include temperature dependency
         # Cell depth of discharge (DoC) as the inverse state of charge (SoC)
         doc = 1 - self.soc
-        # approximation of discharge characteristic from datasheet using two linear approximations.
-        if doc > 0.9:
-            # voltage drop for discharge capacity > 3 Ah
-            self.volt = (
-                self.discharge_volt_slope_nonlin * self.soc * 10  # decreasing voltage for remaining 10 % capacity
-                + 0.5 * self.current / self.discharge_current_max  # offset induced by discharge current
-                + self.volt_min  # minimum voltage at capacity = 0
-            )
-        else:
-            # voltage drop for 0 % - 90 % cell capacity
-            self.volt = (
-                -self.discharge_volt_slope_lin * doc  # decreasing voltage during discharging process
-                + 0.5 * self.current / self.discharge_current_max  # offset induced by discharge current
-                + self.volt_max  # maximum voltage at max capacity
-            )
+        # offset induced by discharge current, shared by both segments of the piecewise approximation
+        volt_offset = 0.5 * self.current / self.discharge_current_max
+        # approximation of discharge characteristic from datasheet using two linear approximations, blended branchless
+        # via the segment selector, so the expression also evaluates elementwise on SoA arrays without a Python branch
+        nonlin = doc > 0.9
+        self.volt = (
+            # voltage drop for discharge capacity > 3 Ah: decreasing voltage for remaining 10 % capacity down to the
+            # minimum voltage at capacity = 0
+            nonlin * (self.discharge_volt_slope_nonlin * self.soc * 10 + volt_offset + self.volt_min)
+            # voltage drop for 0 % - 90 % cell capacity: decreasing voltage during discharging process from the
+            # maximum voltage at max capacity
+            + (1.0 - nonlin) * (-self.discharge_volt_slope_lin * doc + volt_offset + self.volt_max)
+        )
 
     def degrade(self, decrease_per_cycle: float = 0.05 / 140):  # decrease_per_cycle = 0.15
         """
@@ -153,7 +242,7 @@ class Cell:
         # calc dynamic properties again
         self.power = self.volt * self.current  # Cell nominal power [W]
         self.energy = self.power * DT  # Cell nominal energy during time step [Ws]
-        self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.67  # cell capacitance [F]
+        self.capacitance = self.cap_max * CAPACITANCE_FACTOR / self.volt_max  # cell capacitance [F]
 
     def degradation_start(self):
         """
@@ -179,17 +268,9 @@ class Cell:
 
         # power loss at internal resistance
         d_power_loss = self.current**2 * self.internal_resistance  # P = U * I = R * I^2
-        # convection battery <-> air
-        d_power_air = HEAT_TRANS_CONST * BAT_AREA * (self.temp - AMBIENT_TEMPERATURE)  # P = h * A + (T_bat - T_air)
-        # passive cooling power
-        d_power_passive = HEAT_TRANS_CONST * BAT_AREA * (self.temp - BMS_INLETPASSIVETARGET)
-        # active cooling power
-        d_power_cooling = HEAT_TRANS_CONST * BAT_AREA * (self.temp - BMS_INLETACTIVECOOLTARGET)
-        # active heating power
-        d_power_heating = HEAT_TRANS_CONST * BAT_AREA * (self.temp - BMS_INLETACTIVEHEATTARGET)
-
-        # balance
-        d_power_balance = d_power_loss - (d_power_air + d_power_passive + d_power_cooling + d_power_heating)
+        # balance against convection, passive and active cooling/heating: the four h * A * (T_bat - T_target) terms
+        # are folded into one multiply, P = h * A * (4 * T_bat - sum(T_targets))
+        d_power_balance = d_power_loss - K_HA * (4.0 * self.temp - T_ENV_SUM)
         self.temp += (
             d_power_balance * DT * self.temp_efficiency_factor / (self.temp_capacity * self.weight)
         )  # E = P * t
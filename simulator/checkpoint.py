@@ -0,0 +1,115 @@
+# Copyright (C) 2022 - 2023 DSA Skylyze GmbH
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU Affero General
+# Public License as published by the Free Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along with this program.
+# If not, see <https://www.gnu.org/licenses/>.
+# ======================================================================================================================
+import os
+
+import numpy as np
+
+from utils import gather_attributes, scatter_attributes
+
+# electrical and degradation state shared by every component level (cells, stacks, battery)
+COMPONENT_STATE = [
+    "cycle",
+    "cycle_pre",
+    "cap",
+    "cap_max",
+    "cap_max_0",
+    "volt",
+    "volt_min",
+    "volt_max",
+    "soc",
+    "soc_normed",
+    "temp",
+    "current",
+    "internal_resistance",
+    "capacitance",
+    "power",
+    "energy",
+    "weight",
+    "discharge_volt_slope_lin",
+    "discharge_volt_slope_nonlin",
+    "discharge_current_max",
+]
+# additional battery level accumulators
+BATTERY_STATE = ["current_max", "current_min", "energy_charging", "energy_discharging"]
+# integer valued attributes, restored with an explicit cast since the arrays are stored as float
+INT_STATE = "cycle", "cycle_pre"
+
+
+def save_checkpoint(sim, path: str):
+    """
+    Dumps the full state of a simulation (cell, stack and battery arrays plus the simulation scalars) into one npz
+    file. The file is written to a temporary sibling first and swapped in with an atomic rename, so an interrupted
+    save never corrupts the previous checkpoint.
+
+    :param sim: Simulation object whose state should be saved
+    :type sim: battery_simulator.Simulation
+    :param path: Path of the checkpoint file
+    :type path: str
+    """
+
+    bat = sim.bat
+    cells = [cell for stack in bat.stacks for cell in stack.cells]
+    # component state as structure-of-arrays blocks, one namespace prefix per component level
+    arrays = {"cells_" + att: values for att, values in gather_attributes(cells, COMPONENT_STATE).items()}
+    arrays.update({"stacks_" + att: values for att, values in gather_attributes(bat.stacks, COMPONENT_STATE).items()})
+    arrays.update({"bat_" + att: bat.__dict__[att] for att in COMPONENT_STATE + BATTERY_STATE})
+    # simulation scalars needed to resume the run where it stopped; the step counter t is deliberately not part of
+    # the checkpoint: simulate() counts each run from 0 against its own sim_time, so restoring t would make every
+    # following run end immediately
+    arrays["sim_partial_cycle_charging"] = sim.partial_cycle_charging
+    arrays["sim_partial_cycle_discharging"] = sim.partial_cycle_discharging
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(sim, path: str):
+    """
+    Restores the state of an already constructed simulation from a checkpoint file written by save_checkpoint. The
+    battery graph built by create_battery is kept and only its state is overwritten in bulk, so resuming does not
+    have to replay the degradation of the completed cycles.
+
+    :param sim: Simulation object (with battery already created) whose state should be restored
+    :type sim: battery_simulator.Simulation
+    :param path: Path of the checkpoint file
+    :type path: str
+    """
+
+    data = np.load(path)
+    bat = sim.bat
+    cells = [cell for stack in bat.stacks for cell in stack.cells]
+    scatter_attributes(cells, {att: _restore(data["cells_" + att], att) for att in COMPONENT_STATE})
+    scatter_attributes(bat.stacks, {att: _restore(data["stacks_" + att], att) for att in COMPONENT_STATE})
+    for att in COMPONENT_STATE + BATTERY_STATE:
+        value = data["bat_" + att]
+        bat.__dict__[att] = int(value) if att in INT_STATE else float(value)
+    sim.partial_cycle_charging = float(data["sim_partial_cycle_charging"])
+    sim.partial_cycle_discharging = float(data["sim_partial_cycle_discharging"])
+
+
+def _restore(values: np.ndarray, att: str) -> np.ndarray:
+    """
+    Casts a loaded state array back to the dtype the attribute uses on the components.
+
+    :param values: Loaded state array of one attribute for a component population
+    :type values: np.ndarray
+    :param att: Name of the attribute
+    :type att: str
+    :return: State array with the component dtype
+    :rtype: np.ndarray
+    """
+
+    return values.astype(int) if att in INT_STATE else values
@@ -16,6 +16,8 @@ SEED = None
 
 # global time step size [s]
 DT = 1
+# time step size in hours, precomputed so the capacity integration in the hot kernels multiplies instead of divides
+DT_PER_HOUR = DT / 60**2
 
 # desired simulation time [s]
 SIM_TIME = 10 * 60**2 * 24  # 10 days simulation time
@@ -58,7 +60,7 @@ C_MEAN = -2.5
 
 # directory for storing the outputs
 LOGGING_DIR = "output/"
-LOGGING_FORMATS = "tesla"  # "csv", "parquet", "json", "tesla"
+LOGGING_FORMATS = "tesla"  # "csv", "parquet", "feather", "json", "tesla"; prefer parquet/feather over csv for speed
 
 # desired parameter of components to be logged during simulation (for csv, parquet or json)
 LOGGING_PARAMETER = ["cycle", "soc", "volt", "cap_max", "current", "temp"]
@@ -66,6 +68,9 @@ LOGGING_PARAMETER = ["cycle", "soc", "volt", "cap_max", "current", "temp"]
 # dump frequency [steps]
 DUMP_FREQ = 1000
 
+# number of buffered history rows written per parquet part file
+PARQUET_CHUNK = 64 * 1024
+
 # TESLA
 # log every LOG_FREQ [steps]: LVL1 -> bat_volt, LVL2 -> Cell params, LVL3 -> misc.
 LOGGING_FREQ_LVL1 = 5
@@ -82,6 +87,11 @@ BMS_INLETPASSIVETARGET = 45  # [°C]
 BMS_INLETACTIVECOOLTARGET = 50  # [-°C]
 BMS_INLETACTIVEHEATTARGET = -16  # [°C]
 
+# folded constants of the temperature balance: the four convection terms h * A * (T_bat - T_target) share the factor
+# h * A and sum to K_HA * (4 * T_bat - T_ENV_SUM), see Cell.calc_temperature
+K_HA = HEAT_TRANS_CONST * BAT_AREA  # [W/K]
+T_ENV_SUM = AMBIENT_TEMPERATURE + BMS_INLETPASSIVETARGET + BMS_INLETACTIVECOOLTARGET + BMS_INLETACTIVEHEATTARGET  # [°C]
+
 # vehicle load profiles
 # sources:
 #   https://www.adac.de/rund-ums-fahrzeug/autokatalog/marken-modelle/tesla/model-s/1generation/237734/#technische-daten
@@ -11,11 +11,15 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
+import os
+from itertools import cycle
 from typing import List, Generator
 from battery import Battery
 
 import numpy as np
 import pandas as pd
+
+from utils import rand
 from config.constants import (
     DT,
     WLTP_CLASS,
@@ -32,8 +36,118 @@ from config.constants import (
     POWER_LOSS,
 )
 
+# number of random pulses whose amplitudes and lengths are pre-drawn per block
+PULSE_BLOCK = 128
+
+# constant factors of the force balance, folded once at import instead of being recomputed per calc_power call
+# (CPython does not fold products of module-level names)
+_MASS_TOTAL = MASS_VEHICLE + MASS_LOAD  # total mass of car and load [kg]
+_F_ROLL = _MASS_TOTAL * GRAVITATION_CONSTANT * ROLL_RESISTANCE_COEFFICIENT  # rolling resistance factor [N]
+_F_CLIMB = _MASS_TOTAL * GRAVITATION_CONSTANT  # climbing resistance factor [N]
+_F_DRAG = 0.5 * DENSITY_AIR * AIR_RESISTANCE_COEFFICIENT * AREA_CAR_CROSSSECTION  # aerodynamic drag factor [kg/m]
+_F_ACCEL = _MASS_TOTAL * ROTATIONAL_MASS_INERTIA_COEFFICIENT  # acceleration resistance factor [kg]
+# efficiency factors for power gain and drain, precomputed so the direction-dependent transformation becomes a
+# branchless blend instead of a floating-point power with exponent sign(-p)
+_EFF = ELECTRICAL_EFFICIENCY_COEFFICIENT
+_INV_EFF = 1.0 / ELECTRICAL_EFFICIENCY_COEFFICIENT
+
+# cache of loaded driving profiles, so repeated generator creation within one process parses the file only once
+_profile_cache = {}
 
-def calc_power(velocity: float, acceleration: float, slope: float) -> float:
+# cache of precomputed vehicle power traces keyed by profile path (plus interpolation step count), so generators
+# restarted mid-run skip the vectorized power recompute as well as the file parse
+_power_cache = {}
+
+
+def _read_profile_csv(path: str) -> pd.DataFrame:
+    """
+    Parses a driving profile csv-file into its velocity, acceleration and slope columns. The decimal comma forces
+    pandas off its fast C parser path, so the multithreaded pyarrow csv reader is used when available; without it
+    (or if the arrow parse fails) the file is parsed by pandas directly.
+
+    :param path: Path to file containing driving profile
+    :type path: str
+    :return: Parsed profile columns of velocity, acceleration and slope
+    :rtype: pd.DataFrame
+    """
+
+    try:
+        from pyarrow import csv as pacsv
+
+        table = pacsv.read_csv(
+            path,
+            parse_options=pacsv.ParseOptions(delimiter=";"),
+            convert_options=pacsv.ConvertOptions(decimal_point=","),
+        )
+        return table.select(table.column_names[1:4]).to_pandas()
+    except Exception:
+        return pd.read_csv(path, sep=";", decimal=",", usecols=[1, 2, 3])
+
+
+def _load_profile(path: str) -> np.ndarray:
+    """
+    Loads a driving profile file into a NumPy array of its rows. Only the velocity, acceleration and slope columns
+    are parsed and stored; the leading time column is never materialized since the rows are equidistant anyway. A
+    Parquet sidecar of the csv-file is generated on first use and read on subsequent runs, which skips the text
+    parsing and type inference of the csv reader; if the sidecar cannot be written or read, the csv-file is parsed
+    directly. Loaded profiles are cached per process.
+
+    :param path: Path to file containing driving profile
+    :type path: str
+    :return: Profile rows of velocity, acceleration and slope
+    :rtype: np.ndarray
+    """
+
+    values = _profile_cache.get(path)
+    if values is None:
+        parquet_path = path + ".parquet"
+        try:
+            if not os.path.isfile(parquet_path):
+                # write to a temporary sibling and swap it in atomically (as save_checkpoint does), so an
+                # interrupted run never leaves a partial sidecar behind that breaks every later read
+                tmp_path = parquet_path + ".tmp"
+                _read_profile_csv(path).to_parquet(tmp_path)
+                os.replace(tmp_path, parquet_path)
+            values = pd.read_parquet(parquet_path).values
+        except Exception:
+            # no parquet engine installed, unwritable profile directory or an unreadable sidecar; the sidecar is
+            # only a parse cache, so fall back to parsing the csv directly
+            values = _read_profile_csv(path).values
+        # float32 carries the ~3 significant decimals of the profile data with room to spare and halves the cache
+        # footprint of the whole pipeline; the power trace computes in float32 accordingly, battery internals stay
+        # float64 and the conversion happens at the division by the momentary voltage
+        values = values.astype(np.float32)
+        _profile_cache[path] = values
+    return values
+
+
+def _vehicle_power_trace(path: str) -> List:
+    """
+    Computes (or fetches from cache) the state-independent vehicle power trace of a driving profile: one vectorized
+    calc_power pass over the whole profile. Only the scaling by the momentary battery voltage depends on simulation
+    state and stays with the per-step generators.
+
+    :param path: Path to file containing driving profile
+    :type path: str
+    :return: Electrical power per profile step as a plain list of unboxed floats, which is faster to iterate than
+             an ndarray (no per-element boxing into NumPy scalars)
+    :rtype: list
+    """
+
+    powers = _power_cache.get(path)
+    if powers is None:
+        driving_profile = _load_profile(path)
+        # the columns are copied into contiguous arrays first, so the vectorized math runs on cache-friendly memory
+        # instead of strided views of the row-major profile table
+        v = np.ascontiguousarray(driving_profile[:, 0])
+        a = np.ascontiguousarray(driving_profile[:, 1])
+        alpha = np.ascontiguousarray(driving_profile[:, 2])
+        powers = calc_power(velocity=v, acceleration=a, slope=alpha).tolist()
+        _power_cache[path] = powers
+    return powers
+
+
+def calc_power(velocity: np.ndarray, acceleration: np.ndarray, slope: np.ndarray) -> np.ndarray:
     """
     Calculates a balance of forces a car is experiencing during driving. The relevant forces are:
         - rolling resistance force
@@ -41,34 +155,39 @@ def calc_power(velocity: float, acceleration: float, slope: float) -> float:
         - acceleration resistance force
         - acceleration resistance force
     For calculation specific mechanical constants for the car model and velocity, acceleration and slope for the driving
-    profile are used. Finally, the mechanical force is transformed into corresponding electrical power.
+    profile are used. Finally, the mechanical force is transformed into corresponding electrical power. All operations
+    broadcast elementwise, so the whole driving profile is evaluated in one vectorized call instead of once per step.
     Source: https://www.mdpi.com/2032-6653/7/1/41
 
-    :param velocity: Velocity of car for current time step.
-    :type velocity: float
-    :param acceleration: Acceleration of car for current time step.
-    :type acceleration: float
-    :param slope: Slope the car has to overcome for current time step.
-    :type slope: float
+    :param velocity: Velocities of car, one entry per time step.
+    :type velocity: np.ndarray
+    :param acceleration: Accelerations of car, one entry per time step.
+    :type acceleration: np.ndarray
+    :param slope: Slopes the car has to overcome, one entry per time step.
+    :type slope: np.ndarray
     :return: Electrical power the car needs to use for the corresponding force. Negative power means power DRAIN,
              positive power means power GAIN.
-    :rtype: float
+    :rtype: np.ndarray
     """
 
-    f_vehicle = (
-        # rolling resistance force
-        (MASS_VEHICLE + MASS_LOAD) * GRAVITATION_CONSTANT * ROLL_RESISTANCE_COEFFICIENT * np.cos(slope / 180 * np.pi)
-        # aerodynamic drag force
-        + 0.5 * DENSITY_AIR * AIR_RESISTANCE_COEFFICIENT * AREA_CAR_CROSSSECTION * (velocity / 3.6 + VELOCITIY_AIR) ** 2
-        # climbing resistance force
-        + (MASS_VEHICLE + MASS_LOAD) * GRAVITATION_CONSTANT * np.sin(slope / 180 * np.pi)
-        # acceleration resistance force
-        + (MASS_VEHICLE + MASS_LOAD) * acceleration * ROTATIONAL_MASS_INERTIA_COEFFICIENT
-    )
+    # degree -> radian conversion of the slope, computed once and shared by the cos and sin terms
+    rad = np.radians(slope)
+    # accumulate the force balance in place instead of allocating an intermediate array per added term; the terms
+    # are summed in the same left-to-right order as the original expression
+    # rolling resistance force
+    f_vehicle = _F_ROLL * np.cos(rad)
+    # aerodynamic drag force
+    f_vehicle += _F_DRAG * (velocity / 3.6 + VELOCITIY_AIR) ** 2
+    # climbing resistance force
+    f_vehicle += _F_CLIMB * np.sin(rad)
+    # acceleration resistance force
+    f_vehicle += _F_ACCEL * acceleration
     # transformation mechanical vehicle power -> electrical battery power
     p_vehicle = f_vehicle * velocity / 3.6
-    # power balance, POWER_LOSS has to be adjusted to time step size (because it affects p_vehicle, too)
-    return -(p_vehicle * ELECTRICAL_EFFICIENCY_COEFFICIENT ** np.sign(-p_vehicle) + POWER_LOSS)
+    # power balance, POWER_LOSS has to be adjusted to time step size (because it affects p_vehicle, too); the
+    # efficiency divides drained power (p_vehicle > 0) and scales gained power, formerly written as an FP power
+    # with exponent sign(-p_vehicle)
+    return -(np.where(p_vehicle > 0, p_vehicle * _INV_EFF, p_vehicle * _EFF) + POWER_LOSS)
 
 
 class DischargeCurrentProfiles:
@@ -92,6 +211,16 @@ class DischargeCurrentProfiles:
         self.args = args
         self.keep_sending = True
 
+    def __iter__(self) -> Generator:
+        """
+        Makes the profile object directly iterable, delegating to the generator matching the initialization.
+
+        :return: Generator providing discharge current values for every time step.
+        :rtype: Generator
+        """
+
+        return self.select_generator()
+
     def create_random_discharge_current_profile(
         self,
         pulse_len_min: float = 1 * 60,
@@ -120,16 +249,15 @@ class DischargeCurrentProfiles:
 
         # provide signal as long as battery state of charge limit is not reached
         while self.keep_sending:
-            # rand.uniform(low=c_min, high=c_max)  # sample random current amplitude
-            current_val = rand.triangular(left=c_min, mode=c_mean, right=c_max)
-            # sample random current signal length
-            pulse_len = rand.uniform(low=pulse_len_min / DT, high=pulse_len_max / DT)
-            t = 0  # time counter for signal
-            # provide current signal until desired length is reached
-            while t <= pulse_len:
-                t += 1
-                yield current_val
-                self.keep_sending = True
+            # pre-draw the pulse amplitudes and signal lengths for a whole block of pulses in two vectorized calls
+            # instead of two scalar generator draws per pulse
+            # rand.uniform(low=c_min, high=c_max, size=PULSE_BLOCK)  # sample random current amplitudes
+            current_vals = rand.triangular(left=c_min, mode=c_mean, right=c_max, size=PULSE_BLOCK)
+            pulse_lens = rand.uniform(low=pulse_len_min / DT, high=pulse_len_max / DT, size=PULSE_BLOCK)
+            # expand the block into the flat per-step signal in one C-level pass: each pulse amplitude is held for
+            # floor(length) + 1 steps, exactly as the former per-pulse counting loop did
+            signal = np.repeat(current_vals, pulse_lens.astype(int) + 1)
+            yield from signal.tolist()
 
     def vehicle_profile(self, driving_profile_path: str = "driving_protocols/wltp_class3.csv") -> Generator:
         """
@@ -143,14 +271,31 @@ class DischargeCurrentProfiles:
         :rtype: Generator
         """
 
-        driving_profile = pd.read_csv(driving_profile_path, sep=";", decimal=",")
-        # provide signal as long as battery state of charge limit is not reached
-        while self.keep_sending:
-            for _, v, a, alpha in driving_profile.values:
-                # vehicle power due to driving and (de-)acceleration
-                p_bat = calc_power(velocity=v, acceleration=a, slope=alpha)
-                yield p_bat / self.bat.volt / self.bat.cap_max_0  # current [C]
-                self.keep_sending = True
+        powers = _vehicle_power_trace(driving_profile_path)
+        # hoist the attribute lookups out of the steady-state loop; cap_max_0 is fixed after battery creation, only
+        # the momentary voltage has to be read per step
+        bat = self.bat
+        cap_max_0 = bat.cap_max_0
+        # provide signal as long as battery state of charge limit is not reached; itertools.cycle restarts the
+        # profile lap at C level instead of re-entering a nested Python while/for pair, and the consumer closes the
+        # generator when the discharge phase ends
+        for p_bat in cycle(powers):
+            # vehicle power due to driving and (de-)acceleration
+            yield p_bat / bat.volt / cap_max_0  # current [C]
+
+    def power_trace(self, driving_profile_path: str = "driving_protocols/wltp_class3.csv") -> np.ndarray:
+        """
+        Exposes the precomputed, state-independent vehicle power trace as one contiguous array for consumers that
+        can process the profile in columnar chunks. The conversion to a C-value is not included on purpose: it
+        divides by the momentary battery voltage, which is why the generator API yields currents one step at a time.
+
+        :param driving_profile_path: Path to file containing driving profile
+        :type driving_profile_path: str
+        :return: Electrical power per profile step
+        :rtype: np.ndarray
+        """
+
+        return np.asarray(_vehicle_power_trace(driving_profile_path))
 
     def vehicle_profile_interpolate(self, driving_profile_path: str = "driving_protocols/wltp_class3.csv") -> Generator:
         """
@@ -165,22 +310,32 @@ class DischargeCurrentProfiles:
         :rtype: Generator
         """
 
-        driving_profile = pd.read_csv(driving_profile_path, sep=";", decimal=",")
+        num_interp = int(1 / DT)
+        powers = _power_cache.get((driving_profile_path, num_interp))
+        if powers is None:
+            driving_profile = _load_profile(driving_profile_path)
+            # build the interpolated velocity, acceleration and slope traces with one broadcast expansion per
+            # column instead of a nested Python loop appending one step at a time, then pre-materialize the vehicle
+            # power trace in one vectorized pass
+            steps = np.arange(1, num_interp + 1)
+            v, a, alpha = driving_profile[:-1, 0], driving_profile[:-1, 1], driving_profile[:-1, 2]
+            dv = (driving_profile[1:, 0] - v) * DT
+            da = (driving_profile[1:, 1] - a) * DT
+            velocities = (v[:, None] + dv[:, None] * steps).ravel()
+            accelerations = (a[:, None] + da[:, None] * steps).ravel()
+            slopes = np.repeat(alpha, num_interp)
+            powers = calc_power(
+                velocity=velocities, acceleration=accelerations, slope=slopes
+            ).tolist()  # plain list of unboxed floats, cheaper to iterate than the ndarray
+            _power_cache[(driving_profile_path, num_interp)] = powers
+        # hoist the attribute lookups out of the steady-state loop; cap_max_0 is fixed after battery creation, only
+        # the momentary voltage has to be read per step
+        bat = self.bat
+        cap_max_0 = bat.cap_max_0
         # provide signal as long as battery state of charge limit is not reached
-        for (_, v, a, alpha), (__, v_next, a_next, alpha_next) in zip(
-            driving_profile.values[:-1], driving_profile.values[1:]
-        ):
-            count = 0
-            da = (a_next - a) * DT
-            dv = (v_next - v) * DT
-            while count < int(1 / DT):
-                v += dv
-                a += da
-                # vehicle power due to driving and (de-)acceleration
-                p_bat = calc_power(velocity=v, acceleration=a, slope=alpha)
-                count += 1
-                yield p_bat / self.bat.volt / self.bat.cap_max_0  # current [C]
-                self.keep_sending = True
+        for p_bat in powers:
+            # vehicle power due to driving and (de-)acceleration
+            yield p_bat / bat.volt / cap_max_0  # current [C]
 
     def vehicle_profile_sample(self, driving_profile_path: str = "driving_protocols/wltp_class3.csv"):
         """
@@ -196,10 +351,17 @@ class DischargeCurrentProfiles:
         """
         Selects appropriate function to create generator depending on class initialization.
 
+        Note: the generators cannot be moved into a background producer process. The yielded C-value is coupled to
+        the momentary battery voltage of the consuming integrator step, so samples cannot be produced ahead of time;
+        all state-independent work (profile parsing, power-trace computation) is already done up front and cached.
+
         :return: Generator providing discharge current values for every time steps depending on initialization of class.
         :rtype: Generator
         """
 
+        # re-arm the stop flag: each discharge phase requests a fresh generator, and the previous phase ends by
+        # setting keep_sending = False (formerly the flag was re-armed by a dead store on every single yield)
+        self.keep_sending = True
         if self.use_wltp:
             print("Using WLTP " + str(WLTP_CLASS) + " discharge profile.")
             if self.time_step_size > 1:
@@ -12,19 +12,104 @@
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
 import json
+import math
+import operator
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from datetime import datetime, timedelta
 import pandas as pd
-import copy
 from config.constants import *
 from battery import Battery
+
+try:
+    # with pyarrow the parquet log streams into one file through a persistent writer; without it the buffered blocks
+    # fall back to numbered part files via pandas
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 from cell import Cell
 from typing import List, Dict
 from utils import rand
 
-# possible logging parameters
-possible_logging_formats = "csv", "parquet", "json", "tesla"
-possible_logging_parameter = Battery.__dict__.keys()
+# possible logging parameters, frozen for O(1) membership tests (a dict-keys view would also stay live on the class)
+possible_logging_formats = frozenset(("csv", "parquet", "feather", "json", "tesla"))
+possible_logging_parameter = frozenset(Battery.__dict__)
+
+# constant portions of the tesla LVL3 signal bodies, built once so the per-tick calls only splice in the live values
+# instead of re-evaluating the full dict literals
+_TESLA_ENERGY_STATUS_CONST = {
+    "BMS_energyBuffer": 0,  # ?
+    "BMS_energyCounter": 5,  # ?
+    "BMS_energyToChargeComplete": 1.1,  # ?
+}
+# ToDo: Add temperature model
+# values from example json of real Tesla battery
+_TESLA_THERMAL_STATUS_CONST = {
+    "BMS_battTempPct": 33.0,  # ? [%]
+    # status vals: "0": "OFF", "1": "UNAVAILABLE", "2": "HEATING", "3": "COOLING", "4": "COMPLETE"
+    "BMS_dragStripStatus": 1,  # temperature manipulation action ?
+    "BMS_dsTargetTimeEst": 127,  # ? [min]
+    "BMS_flowRequest": 25.0,  # ? [%]
+    "BMS_inletActiveCoolTargetT": 51.0,  # ? [°C]
+    "BMS_inletActiveHeatTargetT": -16.0,  # ? [°C]
+    "BMS_inletPassiveTargetT": 45.0,  # ? [°C]
+    "BMS_noFlowRequest": 0,  # ? possible values: 0 or 1
+    "BMS_powerDissipation": 0.36,  # ? [kW]
+}
+
+
+def _format_csv_value(value) -> str:
+    """
+    Formats one csv cell like pandas' to_csv does: decimal comma for floats, plain str for everything else.
+
+    :param value: Cell value to format
+    :return: Formatted cell text
+    :rtype: str
+    """
+
+    text = str(value)
+    return text.replace(".", ",") if isinstance(value, (float, np.floating)) else text
+
+
+def _write_json(path: str, data: Dict):
+    """
+    Serializes and writes one json log file; runs on the logger's background writer so the simulation step does not
+    stall on file latency.
+
+    :param path: Target file path
+    :type path: str
+    :param data: Payload to serialize
+    :type data: Dict
+    """
+
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+class _ColumnBuffer:
+    """
+    Growable columnar buffer backing one history channel. Values are kept in a preallocated NumPy array, which doubles
+    its capacity when full, so per-step logging performs a plain array store instead of growing Python lists of boxed
+    floats.
+    """
+
+    def __init__(self, dtype=np.float64, capacity: int = 1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            # double the capacity once the buffer is full
+            self.data = np.concatenate([self.data, np.empty(len(self.data), dtype=self.data.dtype)])
+        self.data[self.size] = value
+        self.size += 1
+
+    def values(self) -> np.ndarray:
+        return self.data[: self.size]
 
 
 class Logger:
@@ -47,34 +132,74 @@ class Logger:
 
         self.filepath = filepath
         self.bat = obj
-        # case-insensitive file format for data logging
-        self.formats = [f.lower() for f in np.unique(formats)]
-        # history dict containing the whole progress of desired parameter
-        self.hist = {}
+        # case-insensitive file format for data logging, deduplicated in insertion order (np.unique would sort the
+        # handful of entries through a numpy array round-trip); a single format may be given as a bare string,
+        # which np.unique used to wrap implicitly
+        if isinstance(formats, str):
+            formats = [formats]
+        self.formats = list(dict.fromkeys(f.lower() for f in formats))
+        # columnar buffers containing the whole progress of desired parameter, exposed through the hist property
+        self._hist_buffers = {}
+        # whether logged rows are kept in the global history buffers; long headless runs that only stream csv/json
+        # rows can disable this before simulate to cap the memory footprint (hist then stays empty)
+        self.keep_hist = True
+        # cached (object, channel keys) pairs and one attrgetter over all logging parameters, built at setup so the
+        # per-row gather neither rebuilds key strings nor looks attributes up one by one
+        self._row_objs = []
+        self._values_getter = None
+        self._row_buffers = ()
         # log dict containing only the current state of timestep
         self.log_dict = {}
 
         # file format objects and indicators
-        # self.csv_file = None
+        # long-lived append handle for the csv log, opened once at setup instead of reopening the file per row
+        self._csv_fh = None
         self.csv = False
         # self.parquet_file = None
         self.parquet = False
+        self.feather = False
         # self.json_file = None
         self.json = False
+        # single background writer overlapping json serialization and file I/O with the next simulation steps; the
+        # dumped dicts are never mutated after hand-off, so no copy is needed
+        self._io_pool = None
+        # last submitted write, checked on the next hand-off and at shutdown so a failed dump (full disk,
+        # permissions) raises instead of disappearing inside the pool
+        self._io_future = None
+        # target directory of the json batch files, resolved once at setup instead of per dump
+        self._json_dir = None
+        # counters for chunked parquet export: rows already flushed and index of the next part file
+        self._parquet_rows_flushed = 0
+        self._parquet_part = 0
+        # persistent streaming writer appending row-group chunks to one parquet file (pyarrow only)
+        self._pq_writer = None
 
         # prepare logger if object is provided during initialization
         if obj is not None:
             self.prepare_logger_setup()
-        # logging table header
-        self.hist_head = None
 
         self.time = 0  # internal time for logger, synchronized during simulation
         self.stack_turn = 0  # counter for picking stacks for tesla stack value logging
+        # timestep of the last electrical propagation, so coincident log paths trigger it at most once per step
+        self._propagated_at_time = -1
 
         self.log = lambda x: None  # set logging function depending on logging mode (tesla format or standard)
+        # smallest step stride at which log() does any work; the per-step callers use it to skip the no-op calls
+        self.log_freq = 1
         self.timestamp_latest = None
         self.datetime = None
 
+    @property
+    def hist(self) -> Dict:
+        """
+        History of the logged parameter as columnar arrays, one per channel.
+
+        :return: History dict containing logging parameter at every LOGGING_FREQ time steps
+        :rtype: Dict
+        """
+
+        return {key: buf.values() for key, buf in self._hist_buffers.items()}
+
     def set_logger(self, filepath: str, obj: Battery, formats: List[str]):
         """
         Provides possibility to set the values for the logger, if default values are not desired.
@@ -102,7 +227,7 @@ class Logger:
         :type dict_obj: Dict
         :param name: Object name
         :type name: str
-        :param write: If True, appends value for corresponding key of logging dict. Else creates key.
+        :param write: If True, sets the current value for the corresponding key of the row dict. Else creates key.
         :type write: bool
         :param obj: Object providing parameter for logging
         :type obj: Cell
@@ -112,7 +237,7 @@ class Logger:
 
         for p in LOGGING_PARAMETER:
             if write:
-                dict_obj[name + "_" + p].append(obj.__dict__[p])
+                dict_obj[name + "_" + p] = obj.__dict__[p]
             else:
                 dict_obj[name + "_" + p] = []
         return dict_obj
@@ -137,9 +262,13 @@ class Logger:
         return dict_obj
 
     # history
-    def create_hist(self) -> Dict:
+    def create_hist(self, capacity: int = 1024) -> Dict:
         """
-        Creates the backbone history object (headers but no values) for logging the process of the simulation.
+        Creates the backbone history object (headers but no values) for logging the process of the simulation and
+        allocates one columnar buffer per channel.
+
+        :param capacity: Initial number of rows to preallocate per channel buffer
+        :type capacity: int
         """
 
         hist = {"time": [], "timestamp": []}
@@ -151,76 +280,129 @@ class Logger:
             # for c in s.cells:
             #     cell_name = c.name
             #     hist = self.add_value_hist(hist, cell_name)
-        self.hist = hist
+        # freeze the logged objects with their channel key strings and build one attrgetter fetching all logging
+        # parameters per object in a single C call
+        self._row_objs = [
+            (obj, tuple(obj.name + "_" + p for p in LOGGING_PARAMETER)) for obj in [self.bat] + list(self.bat.stacks)
+        ]
+        # attrgetter returns a bare value for a single name, so wrap it to keep the row builders on tuples
+        getter = operator.attrgetter(*LOGGING_PARAMETER)
+        if len(LOGGING_PARAMETER) == 1:
+            self._values_getter = lambda obj, _get=getter: (_get(obj),)
+        else:
+            self._values_getter = getter
+        # the timestamp strings live in an object buffer and the simulation time in a float64 buffer; the telemetry
+        # channels only carry 3-4 significant digits, so float32 halves their memory and file footprint
+        self._hist_buffers = {
+            key: _ColumnBuffer(
+                dtype=object if key == "timestamp" else np.float64 if key == "time" else np.float32,
+                capacity=capacity,
+            )
+            for key in hist
+        }
+        # frozen (key, buffer) sequence for the per-row store, skipping the dict-view iteration per logged row
+        self._row_buffers = tuple(self._hist_buffers.items())
         return hist
 
-    def update_hist(self, time: float) -> Dict:
+    def format_timestamp(self, time: float) -> str:
+        """
+        Formats the ISO timestamp of a simulation timestep relative to the start datetime.
+
+        :param time: Current timestep of simulation.
+        :type time: float
+        :return: Timestamp as ISO string with millisecond precision and "Z" suffix.
+        :rtype: str
+        """
+
+        return (self.datetime + timedelta(seconds=time * DT)).replace(tzinfo=None).isoformat()[:-3] + "Z"
+
+    def propagate_electric(self, time: float):
+        """
+        Propagates electrical battery attributes to stacks and cells at most once per timestep, so log paths firing
+        on coincident frequencies do not repeat the fan-out.
+
+        :param time: Current timestep of simulation.
+        :type time: float
+        """
+
+        if self._propagated_at_time != time:
+            self.bat.propagate_attributes(electric=True)
+            self._propagated_at_time = time
+
+    def update_hist(self, time: float, timestamp: str = None) -> Dict:
         """
         Updates parameter recursively for objects used in simulation to history dict.
 
         :param time: Current timestep of simulation.
         :type time: float
-        :return: History dictionary containing progress of desired parameter in LOG_FREQ steps.
+        :param timestamp: Preformatted timestamp of the timestep, formatted from time if not provided.
+        :type timestamp: str
+        :return: History dictionary containing the row of the current timestep, one single-element list per channel.
         :rtype: Dict
         """
 
-        # deepcopy history header to prevent mixing up with previous time steps
-        hist = copy.deepcopy(self.hist_head)
+        # build the current row as a flat dict of scalars; the former deepcopy of an empty-list skeleton plus merge
+        # rebuilt and walked every channel twice per logged row
+        row = {}
         # time for simulation [s]
-        hist["time"].append(time * DT)
+        row["time"] = time * DT
         # timestamp for use case
-        timestamp = (self.datetime + timedelta(seconds=time * DT)).replace(tzinfo=None).isoformat()[:-3] + "Z"
-        hist["timestamp"].append(timestamp)
+        if timestamp is None:
+            timestamp = self.format_timestamp(time)
+        row["timestamp"] = timestamp
         self.timestamp_latest = timestamp
-        for b in [self.bat]:
-            bat_name = b.name
-            hist = self.add_value_hist(hist, bat_name, write=True, obj=b)
-            for s in b.stacks:
-                stack_name = s.name
-                hist = self.add_value_hist(hist, stack_name, write=True, obj=s)
-                # for c in s.cells:
-                #     cell_name = c.name
-                #     hist = self.add_value_hist(hist, cell_name, write=True, obj=c)
-
-        # merge values of current timestep to global history dict ("add row to logging table")
-        for key in self.hist.keys():
-            self.hist[key].append(*hist[key])
-        return hist
+        # gather all logging parameters per object with the cached keys and attrgetter; the state lives in per-object
+        # __dict__ scalars rather than typed arrays, so a compiled gather kernel has nothing array-shaped to operate
+        # on — the attrgetter reads all parameters and dict.update stores them in one C call each
+        values_getter = self._values_getter
+        for obj, keys in self._row_objs:
+            row.update(zip(keys, values_getter(obj)))
+
+        # merge values of current timestep to global history buffers ("add row to logging table")
+        if self.keep_hist:
+            for key, buf in self._row_buffers:
+                buf.append(row[key])
+        # the file writers consume one-row tables, so each scalar is wrapped in a single-element list
+        return {key: [value] for key, value in row.items()}
 
     # logger
-    def update_log(self, time: float) -> Dict:
+    def update_log(self, time: float, timestamp: str = None) -> Dict:
         """
         Updates parameter recursively for objects used in simulation to log dict.
 
         :param time: Current timestep of simulation.
         :type time: float
+        :param timestamp: Preformatted timestamp of the timestep, formatted from time if not provided.
+        :type timestamp: str
         :return: Logging dictionary containing the current row of desired parameter.
         :rtype: Dict
         """
 
-        timestamp = (self.datetime + timedelta(seconds=time * DT)).replace(tzinfo=None).isoformat()[:-3] + "Z"
+        if timestamp is None:
+            timestamp = self.format_timestamp(time)
         hist = {"timestamp": timestamp}
         signals = {}
         self.timestamp_latest = timestamp
-        for b in [self.bat]:
-            bat_name = b.name
-            signals = self.add_value_log(signals, bat_name, obj=b)
-            for s in b.stacks:
-                stack_name = s.name
-                signals = self.add_value_log(signals, stack_name, obj=s)
-                # for c in s.cells:
-                #     cell_name = c.name
-                #     signals = self.add_value_log(signals, cell_name, obj=c)
+        # gather all logging parameters per object with the cached keys and attrgetter, storing each object's values
+        # through a single dict.update; floats are rounded at insertion, so the fast C json encoder emits the
+        # intended 3 decimal places
+        values_getter = self._values_getter
+        for obj, keys in self._row_objs:
+            signals.update(
+                zip(keys, (round(value, 3) if isinstance(value, float) else value for value in values_getter(obj)))
+            )
         hist["signals"] = signals
         return hist
 
-    def prepare_logger_setup(self, timestamp_start: str = None):
+    def prepare_logger_setup(self, timestamp_start: str = None, sim_time: int = None):
         """
         Prepares the logging variables for log and hist. Also writes values for t = 0 and sets up file writers for
         desired file formats.
 
         :param timestamp_start: Initial timestamp of simulation
         :type timestamp_start: str
+        :param sim_time: Planned simulation time [s], used to preallocate the history buffers in one piece
+        :type sim_time: int
         """
 
         # set starting_time
@@ -230,26 +412,30 @@ class Logger:
             else datetime.strptime(timestamp_start, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(seconds=60)
         )
         if "tesla" in self.formats:
-            # prepare json encoder to output floats with fewer decimal places
-            class RoundingFloat(float):
-                __repr__ = staticmethod(lambda x: format(x, ".3f"))
-
-            json.encoder.float = RoundingFloat
-
             self.log_dict = {
                 "deviceId": DEVICE_NAME,
                 "messageType": "DECODED_CAN_MESSAGES",
                 "signalsByTimestampList": [],
             }
+            self._io_pool = ThreadPoolExecutor(max_workers=1)
+            self._json_dir = self.filepath + "logs/"
+            os.makedirs(self._json_dir, exist_ok=True)
             self.log = self.log_tesla  # set logger to tesla mode
+            # tesla logging only acts at multiples of the signal levels and the dump frequency
+            self.log_freq = math.gcd(LOGGING_FREQ_LVL1, LOGGING_FREQ_LVL2, LOGGING_FREQ_LVL3, DUMP_FREQ)
         else:
-            # create history dict with parameter corresponding to battery object
-            self.hist = self.create_hist()
-            self.hist_head = copy.deepcopy(self.hist)
+            # parquet and feather export from the history buffers at flush time, so they override a keep_hist opt-out
+            if "parquet" in self.formats or "feather" in self.formats:
+                self.keep_hist = True
+            # create history template and columnar buffers with parameter corresponding to battery object; one row
+            # is logged every DUMP_FREQ steps, so the planned simulation time sizes the buffers up front (the last
+            # cycle may overrun sim_time, which the growth path of the buffers absorbs)
+            capacity = 1024 if sim_time is None else int(sim_time / (DT * DUMP_FREQ)) + 2
+            self.create_hist(capacity=capacity)
 
             # log values for t = 0
             # propagate electrical properties to stacks and cells
-            self.bat.propagate_attributes(electric=True)
+            self.propagate_electric(time=0)
             # append current values to log dict
             hist = self.update_hist(time=0)
 
@@ -257,19 +443,23 @@ class Logger:
                 if form == "csv":
                     # convert hist into pandas dataframe for saving
                     hist_pandas = pd.DataFrame(hist)
-                    # write into .csv file
+                    # write header and t = 0 row into .csv file
                     hist_pandas.to_csv(self.filepath + "log.csv", sep=";", decimal=",", mode="w", index=False)
+                    # further rows go through a buffered long-lived handle, skipping the per-row DataFrame
+                    # construction and file reopen of to_csv
+                    self._csv_fh = open(self.filepath + "log.csv", "a", buffering=1 << 20)
                     self.csv = True
                 elif form == "parquet":
                     self.parquet = True
+                elif form == "feather":
+                    # feather files cannot be appended to; the buffered history is written once at the end
+                    self.feather = True
                 elif form == "json":
-                    # prepare json encoder to output floats with fewer decimal places
-                    class RoundingFloat(float):
-                        __repr__ = staticmethod(lambda x: format(x, ".3f"))
-
-                    json.encoder.float = RoundingFloat
                     self.log_dict = {"deviceId": DEVICE_NAME, "signalsByTimestampList": []}
 
+                    self._io_pool = ThreadPoolExecutor(max_workers=1)
+                    self._json_dir = self.filepath + "logs/"
+                    os.makedirs(self._json_dir, exist_ok=True)
                     self.json = True
 
                     log_dict = self.update_log(time=0)
@@ -278,10 +468,12 @@ class Logger:
                 else:
                     print(
                         "No valid data format for logging provided. There will be no files saved for the simulation!\nSupported file formats are: {}".format(
-                            possible_logging_formats
+                            ", ".join(sorted(possible_logging_formats))
                         )
                     )
             self.log = self.log_std  # set logger to std mode
+            # standard logging only acts at multiples of the dump frequency
+            self.log_freq = DUMP_FREQ
 
     def log_json(self, data: Dict, time: float):
         """
@@ -293,8 +485,10 @@ class Logger:
         :type time: float
         """
 
-        with open(self.filepath + "logs/log_" + str(time) + ".json", "w") as f:
-            json.dump(data, f)
+        # surface any failure of the previous dump before handing off the next one
+        if self._io_future is not None:
+            self._io_future.result()
+        self._io_future = self._io_pool.submit(_write_json, self._json_dir + "log_" + str(time) + ".json", data)
 
         self.log_dict = {"deviceId": DEVICE_NAME, "signalsByTimestampList": []}
 
@@ -306,23 +500,89 @@ class Logger:
         :type data: dict
         """
 
-        # convert hist into pandas dataframe for saving
-        hist_pandas = pd.DataFrame(data)
-        # write into .csv file
-        hist_pandas.to_csv(self.filepath + "log.csv", sep=";", decimal=",", mode="a", header=False, index=False)
+        # format the one-row table as a single pre-built line; the channel order matches the header written at setup.
+        # rows only arrive every DUMP_FREQ steps and land in the handle's 1 MiB buffer, so the file sees large batched
+        # writes already — a DataFrame round-trip per batch would cost more than it saves
+        self._csv_fh.write(";".join(_format_csv_value(values[0]) for values in data.values()) + "\n")
 
-    def log_parquet(self, data: Dict):
+    def log_parquet(self, data: Dict, part: int = None):
         """
         Logs data to parquet file
 
         :param data: Values of current timestep in simulation
         :type data: dict
+        :param part: Index of the part file to write. If None, write the single file "log.parquet".
+        :type part: int
         """
 
+        filename = "log.parquet" if part is None else "log_part" + str(part) + ".parquet"
         # convert hist into pandas dataframe for saving
         hist_pandas = pd.DataFrame(data)
         # write into .parquet file
-        hist_pandas.to_parquet(self.filepath + "log.parquet", engine="auto", index=False)
+        hist_pandas.to_parquet(self.filepath + filename, engine="auto", index=False)
+
+    def log_feather(self, data: Dict):
+        """
+        Logs data to feather file.
+
+        :param data: Values of the buffered simulation history
+        :type data: dict
+        """
+
+        # convert hist into pandas dataframe for saving
+        hist_pandas = pd.DataFrame(data)
+        # write into .feather file
+        hist_pandas.to_feather(self.filepath + "log.feather")
+
+    def finalize_logs(self):
+        """
+        Writes the file outputs that are produced once at the end of the simulation: the remaining partial parquet
+        block and, if enabled, the feather dump of the whole buffered history.
+        """
+
+        # wait for the background writer to drain before the run finishes and re-raise if the last dump failed
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
+            self._io_pool = None
+        if self._io_future is not None:
+            future, self._io_future = self._io_future, None
+            future.result()
+        if self.csv and self._csv_fh is not None:
+            self._csv_fh.close()
+            self._csv_fh = None
+        if self.parquet:
+            self.flush_parquet(final=True)
+        if self.feather:
+            self.log_feather(self.hist)
+
+    def flush_parquet(self, final: bool = False):
+        """
+        Writes buffered history rows to the parquet log in blocks of PARQUET_CHUNK rows. With pyarrow the blocks
+        stream as row groups into one file through a persistent writer; otherwise they become numbered part files.
+        Exporting full blocks as they accumulate keeps the write sizes large and bounded instead of rewriting one
+        growing file.
+
+        :param final: If True, also writes the remaining partial block at the end of the simulation and closes the
+                      streaming writer.
+        :type final: bool
+        """
+
+        rows = next(iter(self._hist_buffers.values())).size if self._hist_buffers else 0
+        while (rows - self._parquet_rows_flushed >= PARQUET_CHUNK) or (final and rows > self._parquet_rows_flushed):
+            stop = min(self._parquet_rows_flushed + PARQUET_CHUNK, rows)
+            data = {key: buf.values()[self._parquet_rows_flushed : stop] for key, buf in self._hist_buffers.items()}
+            if pa is not None:
+                table = pa.Table.from_pydict(data)
+                if self._pq_writer is None:
+                    self._pq_writer = pq.ParquetWriter(self.filepath + "log.parquet", table.schema)
+                self._pq_writer.write_table(table)
+            else:
+                self.log_parquet(data, part=self._parquet_part)
+            self._parquet_rows_flushed = stop
+            self._parquet_part += 1
+        if final and self._pq_writer is not None:
+            self._pq_writer.close()
+            self._pq_writer = None
 
     def log_std(self, time: float):
         """
@@ -333,16 +593,21 @@ class Logger:
         """
 
         if time % DUMP_FREQ == 0:
+            # format the timestamp once per logged step and pass it down, instead of once per update call
+            timestamp = self.format_timestamp(time)
             # propagate electrical properties to stacks and cells
-            self.bat.propagate_attributes(electric=True)
+            self.propagate_electric(time=time)
             # append current values to log dict
-            hist = self.update_hist(time=time)
+            hist = self.update_hist(time=time, timestamp=timestamp)
             # dump log files
             if self.csv:
                 self.log_csv(hist)
+            if self.parquet:
+                # write full PARQUET_CHUNK blocks of buffered rows as part files
+                self.flush_parquet()
             if self.json:
                 # update logging dict
-                log_dict = self.update_log(time=time)
+                log_dict = self.update_log(time=time, timestamp=timestamp)
                 self.log_json(log_dict, time=time)
 
     def pick_stack_volt_and_temp(self, num_stacks: int = 4):
@@ -354,8 +619,9 @@ class Logger:
         """
 
         sig = {}
-        idx_list = np.arange(self.stack_turn, self.stack_turn + num_stacks)
-        np.random.shuffle(idx_list)
+        # a plain list shuffle; numpy's array shuffle costs far more than it saves for a handful of indices
+        idx_list = list(range(self.stack_turn, self.stack_turn + num_stacks))
+        random.shuffle(idx_list)
         c = 0  # counter for replacing idx > len(num_stacks)
         for idx in idx_list:
             if idx >= len(self.bat.stacks):
@@ -363,10 +629,10 @@ class Logger:
                 c += 1
             sig["BMS_Cell_" + str(idx + 1) + "_Voltage"] = self.bat.stacks[idx].volt
             sig["BMS_Cell_" + str(idx + 1) + "_Temp"] = self.bat.stacks[idx].temp
-        self.stack_turn = np.max(idx_list) + 1 if c == 0 else c
+        self.stack_turn = max(idx_list) + 1 if c == 0 else c
         return sig
 
-    def tesla_signals_schema(self, time: float, message_type: str, signals: Dict) -> Dict:
+    def tesla_signals_schema(self, time: float, message_type: str, signals: Dict, timestamp: str = None) -> Dict:
         """
         Generates the Tesla Model S BMS signal body in a json format.
         For reference, visit: https://www.ti.com/document-viewer/BQ76PL536A-Q1/datasheet
@@ -377,16 +643,20 @@ class Logger:
         :type message_type: str
         :param signals: Logging data
         :type signals: dict
+        :param timestamp: Preformatted timestamp of the timestep, formatted from time if not provided.
+        :type timestamp: str
         :return: Logging signal, which is added to overall logging file
         :rtype: dict
         """
 
-        timestamp = (self.datetime + timedelta(seconds=time * DT)).replace(tzinfo=None).isoformat()[:-3] + "Z"
+        if timestamp is None:
+            timestamp = self.format_timestamp(time)
         self.timestamp_latest = timestamp
         return {
             "timestamp": timestamp,
             "canMessageName": message_type,
-            "signals": signals,
+            # round floats at insertion, so the fast C json encoder emits the intended 3 decimal places
+            "signals": {key: round(value, 3) if isinstance(value, float) else value for key, value in signals.items()},
         }
 
     def tesla_signals(self, time: float):
@@ -402,10 +672,13 @@ class Logger:
         :type time: float
         """
 
+        # all message types of one timestep share the same timestamp, so format it once per call
+        timestamp = self.format_timestamp(time)
         if time % LOGGING_FREQ_LVL1 == 0:
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="BMS_Current_And_Voltage_AWD",
                     signals={
                         "BMS_Pack_Voltage": self.bat.volt,
@@ -416,15 +689,19 @@ class Logger:
             )
         if time % LOGGING_FREQ_LVL2 == 0:
             # propagate electrical parameter from battery to stacks
-            self.bat.propagate_attributes(electric=True)
+            self.propagate_electric(time=time)
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
-                    time=time, message_type="BMS_cellMonitoring", signals=self.pick_stack_volt_and_temp(num_stacks=4)
+                    time=time,
+                    timestamp=timestamp,
+                    message_type="BMS_cellMonitoring",
+                    signals=self.pick_stack_volt_and_temp(num_stacks=4),
                 )
             )
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="Battery_Power_Limits",
                     signals={
                         "Max_Regen_Power": self.bat.current_max * self.bat.volt / 1000,  # power in kW
@@ -436,9 +713,12 @@ class Logger:
             self.bat.current_min = 0
             self.bat.current_max = 0
         if time % LOGGING_FREQ_LVL3 == 0:
+            # the three remaining-energy channels report the same product, so compute it once
+            energy_remaining = self.bat.cap * self.bat.volt / 1000
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="Battery_SOC",
                     signals={
                         "SOC_Min": self.bat.soc_normed * 100,  # ToDo: What's the difference between those?
@@ -449,15 +729,14 @@ class Logger:
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="BMS_energyStatus",
                     signals={
-                        "BMS_energyBuffer": 0,  # ?
-                        "BMS_energyCounter": 5,  # ?
-                        "BMS_energyToChargeComplete": 1.1,  # ?
+                        **_TESLA_ENERGY_STATUS_CONST,
                         # ToDo: What's the difference between those values?
-                        "BMS_expectedEnergyRemaining": self.bat.cap * self.bat.volt / 1000,  # ? [J = Ah * V]
-                        "BMS_idealEnergyRemaining": self.bat.cap * self.bat.volt / 1000,  # ? [kWh]
-                        "BMS_nominalEnergyRemaining": self.bat.cap * self.bat.volt / 1000,  # ? [kWh]
+                        "BMS_expectedEnergyRemaining": energy_remaining,  # ? [J = Ah * V]
+                        "BMS_idealEnergyRemaining": energy_remaining,  # ? [kWh]
+                        "BMS_nominalEnergyRemaining": energy_remaining,  # ? [kWh]
                         "BMS_nominalFullPackEnergy": self.bat.cap_max * self.bat.volt_max / 1000,  # ? [kWh]
                     },
                 )
@@ -465,27 +744,15 @@ class Logger:
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="BMS_thermalStatus",
-                    # ToDo: Add temperature model
-                    # values from example json of real Tesla battery
-                    signals={
-                        "BMS_battTempPct": 33.0,  # ? [%]
-                        # status vals: "0": "OFF", "1": "UNAVAILABLE", "2": "HEATING", "3": "COOLING", "4": "COMPLETE"
-                        "BMS_dragStripStatus": 1,  # temperature manipulation action ?
-                        "BMS_dsTargetTimeEst": 127,  # ? [min]
-                        "BMS_flowRequest": 25.0,  # ? [%]
-                        "BMS_inletActiveCoolTargetT": 51.0,  # ? [°C]
-                        "BMS_inletActiveHeatTargetT": -16.0,  # ? [°C]
-                        "BMS_inletPassiveTargetT": 45.0,  # ? [°C]
-                        "BMS_noFlowRequest": 0,  # ? possible values: 0 or 1
-                        "BMS_packTemperature": self.bat.temp,  # [°C]
-                        "BMS_powerDissipation": 0.36,  # ? [kW]
-                    },
+                    signals={**_TESLA_THERMAL_STATUS_CONST, "BMS_packTemperature": self.bat.temp},  # [°C]
                 )
             )
             self.log_dict["signalsByTimestampList"].append(
                 self.tesla_signals_schema(
                     time=time,
+                    timestamp=timestamp,
                     message_type="Battery_Lifetime_Energy_Stats",
                     signals={
                         "Discharge_Total": self.bat.energy_discharging / 60**2,  # [Wh]
@@ -505,8 +772,13 @@ class Logger:
         self.tesla_signals(time=time)
         # ToDo: Add synchronous file sending if wanted
         if time % DUMP_FREQ == 0:
-            with open(self.filepath + "logs/log_" + str(time) + ".json", "w") as f:
-                json.dump(self.log_dict, f)
+            # the batch is handed to the background writer as-is and a fresh dict takes its place; serializing each
+            # record into a byte buffer at append time would instead put the encode work back on the simulation thread
+            if self._io_future is not None:
+                self._io_future.result()
+            self._io_future = self._io_pool.submit(
+                _write_json, self._json_dir + "log_" + str(time) + ".json", self.log_dict
+            )
             self.log_dict = {
                 "deviceId": DEVICE_NAME,
                 "messageType": "DECODED_CAN_MESSAGES",
@@ -11,9 +11,29 @@
 # You should have received a copy of the GNU Affero General Public License along with this program.
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
+from functools import lru_cache
 from typing import List
-from cell import Cell
-from utils import add_noise
+
+import numpy as np
+
+from cell import Cell, CAPACITANCE_FACTOR, calc_state_of_charge_batch
+from utils import add_noise, broadcast_attributes
+
+
+@lru_cache(maxsize=None)
+def _parse_config(config: str):
+    """
+    Parses a wiring configuration like "6S74P" into its serial and parallel counts. Batteries are built from many
+    identically configured stacks, so the result is cached per unique string.
+
+    :param config: Wiring configuration, upper case
+    :type config: str
+    :return: Number of serially and parallely wired cells
+    :rtype: tuple
+    """
+
+    num_s, rest = config.split("S")
+    return int(num_s), int(rest.split("P")[0])
 
 
 class Stack(Cell):
@@ -41,8 +61,10 @@ class Stack(Cell):
         self.cells = cell_list
         # ToDo: Check this explicitly, what if order is e.g., flipped?
         self.config = config.upper()  # configuration of stack has to be provided using this syntax
-        self.config_num_s = int(self.config.split("S")[0])
-        self.config_num_p = int(self.config.split("S")[1].split("P")[0])
+        self.config_num_s, self.config_num_p = _parse_config(self.config)
+        # cached inverse wiring factors, turning the per-propagation divisions into multiplications
+        self._inv_s = 1.0 / self.config_num_s
+        self._inv_p = 1.0 / self.config_num_p
         # ToDo: division by 0 are possible for s, p. How to avoid?
         self.cells_serial = None
         self.cells_parallel = None
@@ -54,133 +76,87 @@ class Stack(Cell):
     def calc_stack_prop(self):
         """
         Calculates the electrical properties of stack as the combination of wired cells, depending on config.
+        The scalar accumulator loops are replaced by NumPy reductions over arrays of shape (groups, group size), which
+        keeps the aggregation at C level even for stacks composed of hundreds of cells (see Battery.calc_bat_prop).
         """
 
-        c = 0  # counter variable for current cell
-        # create group of parallely wired cells first, then stack those serially
-        if self.config_num_p >= self.config_num_s:
-            for s in range(self.config_num_s):
-                p = 0  # counter variable for number of parallely wired cells
-                # initialise stack group parameter
-                stack_voltage = 0
-                stack_capacity = 0
-                stack_capacity_max = 0
-                stack_weight = 0
-                stack_voltage_min = 0
-                stack_voltage_max = 0
-                stack_current = 0
-                stack_discharge_current_max = 0
-                stack_internal_resistance = 0
-                stack_discharge_voltage_slope_lin = 0
-                stack_discharge_voltage_slope_nonlin = 0
-                stack_temperature = 0
-                while p < self.config_num_p:  # set parameter according to values in single cells
-                    cell = self.cells[c]  # select cell from list
-                    # tag cell to retrace components in wiring
-                    cell.tag = "s" + str(s) + "_p" + str(p)
-                    stack_voltage += cell.volt
-                    stack_voltage_min += cell.volt_min
-                    stack_voltage_max += cell.volt_max
-                    stack_discharge_voltage_slope_lin += cell.discharge_volt_slope_lin
-                    stack_discharge_voltage_slope_nonlin += cell.discharge_volt_slope_nonlin
-                    stack_internal_resistance += cell.internal_resistance
-                    stack_current += cell.current
-                    stack_discharge_current_max += cell.discharge_current_max
-                    stack_capacity += cell.cap
-                    stack_capacity_max += cell.cap_max
-                    stack_weight += cell.weight
-                    stack_temperature += cell.temp
-                    p += 1
-                    c += 1
-                # add mean of parameters (division by p) to stack, if they are not affected by parallel wiring
-                self.volt += stack_voltage / p
-                self.volt_min += stack_voltage_min / p
-                self.volt_max += stack_voltage_max / p
-                self.discharge_volt_slope_lin += stack_discharge_voltage_slope_lin / p
-                self.discharge_volt_slope_nonlin += stack_discharge_voltage_slope_nonlin / p
-                self.internal_resistance += stack_internal_resistance / p
-                self.temp += stack_temperature / p
-                self.current += stack_current
-                self.discharge_current_max += stack_discharge_current_max
-                self.cap += stack_capacity
-                self.cap_max += stack_capacity_max
-                self.weight += stack_weight
-            # scale parameters by number of serially wired cells
-            self.cap /= self.config_num_s
-            self.cap_max /= self.config_num_s
-            self.current /= self.config_num_s
-            self.temp /= self.config_num_s
-
-            self.internal_resistance /= self.config_num_s
-
-            self.discharge_current_max /= self.config_num_s
+        num_s = self.config_num_s
+        num_p = self.config_num_p
+        cells = self.cells[: num_s * num_p]
+
+        # parameter not affected by parallel wiring: mean over a parallel group, summed over serial groups
+        atts_mean = [
+            "volt",
+            "volt_min",
+            "volt_max",
+            "discharge_volt_slope_lin",
+            "discharge_volt_slope_nonlin",
+            "internal_resistance",
+            "temp",
+        ]
+        # additive parameter for parallel wiring
+        atts_add = ["current", "discharge_current_max", "cap", "cap_max"]
+        atts = atts_mean + atts_add + ["weight"]
+
+        # both wiring orders share one reduction skeleton over blocks of shape (groups, group size, num_attributes):
+        # the attribute columns before the split index are reduced with one rule, the columns after it (up to the
+        # trailing weight) with the other, and a branch-specific set of attributes is scaled by the group count
+        if num_p >= num_s:
+            # group parallely wired cells first, then stack those serially; cells are laid out serial-major, the
+            # mean-type attributes are averaged per parallel group and the additive ones summed over all cells
+            groups, group_size = num_s, num_p
+            split = len(atts_mean)
+            mean_head = True
+            scaled = ("cap", "cap_max", "current", "temp", "internal_resistance", "discharge_current_max")
+            for idx, cell in enumerate(cells):
+                cell.tag = (idx // num_p, idx % num_p)
         # ToDo: Is this case needed? Could it be also handled above?
-        # create group of serially wired cells first, then stack those parallely
         else:
-            for p in range(self.config_num_p):
-                s = 0  # counter variable for serially wired cells
-                # initialise stack group parameter
-                stack_voltage = 0
-                stack_capacity = 0
-                stack_capacity_max = 0
-                stack_weight = 0
-                stack_voltage_min = 0
-                stack_voltage_max = 0
-                stack_current = 0
-                stack_discharge_current_max = 0
-                stack_internal_resistance = 0
-                stack_discharge_voltage_slope_lin = 0
-                stack_discharge_voltage_slope_nonlin = 0
-                stack_temperature = 0
-                # set parameter according to values in single cells
-                while s < self.config_num_s:
-                    cell = self.cells[c]  # select cell from list
-                    # tag cell name to retrace components in wiring
-                    cell.tag = "s" + str(s) + "_p" + str(p)
-                    stack_voltage += cell.volt
-                    stack_voltage_min += cell.volt_min
-                    stack_voltage_max += cell.volt_max
-                    stack_discharge_voltage_slope_lin += cell.discharge_volt_slope_lin
-                    stack_discharge_voltage_slope_nonlin += cell.discharge_volt_slope_nonlin
-                    stack_internal_resistance += cell.internal_resistance
-                    stack_current += cell.current
-                    stack_discharge_current_max += cell.discharge_current_max
-                    stack_capacity += cell.cap
-                    stack_capacity_max += cell.cap_max
-                    stack_weight += cell.weight
-                    stack_temperature += cell.temp
-                    s += 1
-                    c += 1
-                # add mean of parameters (division by s) to stack, if they are not affected by serial wiring
-                self.volt += stack_voltage
-                self.volt_min += stack_voltage_min
-                self.volt_max += stack_voltage_max
-                self.discharge_volt_slope_lin += stack_discharge_voltage_slope_lin
-                self.discharge_volt_slope_nonlin += stack_discharge_voltage_slope_nonlin
-                self.internal_resistance += stack_internal_resistance
-                self.current += stack_current / s
-                self.discharge_current_max += stack_discharge_current_max / s
-                self.cap += stack_capacity / s
-                self.cap_max += stack_capacity_max / s
-                self.temp += stack_temperature / s
-                self.weight += stack_weight
-            # scale parameters according to number of parallely wired cells
-            self.volt /= self.config_num_p
-            self.volt_min /= self.config_num_p
-            self.volt_max /= self.config_num_p
-            self.discharge_volt_slope_lin /= self.config_num_p
-            self.discharge_volt_slope_nonlin /= self.config_num_p
-            self.internal_resistance /= self.config_num_p
-            self.temp /= self.config_num_p
+            # group serially wired cells first, then stack those parallely; cells are laid out parallel-major, the
+            # voltage-like attributes are summed over all cells and temp plus the additive ones averaged per group
+            groups, group_size = num_p, num_s
+            split = len(atts_mean) - 1
+            mean_head = False
+            scaled = (
+                "volt",
+                "volt_min",
+                "volt_max",
+                "discharge_volt_slope_lin",
+                "discharge_volt_slope_nonlin",
+                "internal_resistance",
+                "temp",
+            )
+            for idx, cell in enumerate(cells):
+                cell.tag = (idx % num_s, idx // num_s)
+
+        # collect all cell attributes in one traversal; fromiter fills the contiguous buffer directly instead of
+        # building nested Python lists first
+        blocks = np.fromiter(
+            (cell.__dict__[att] for cell in cells for att in atts), dtype=float, count=len(cells) * len(atts)
+        ).reshape(groups, group_size, len(atts))
+        if mean_head:
+            head_vals = blocks[:, :, :split].mean(axis=1).sum(axis=0)
+            tail_vals = blocks[:, :, split:-1].sum(axis=(0, 1))
+        else:
+            head_vals = blocks[:, :, :split].sum(axis=(0, 1))
+            tail_vals = blocks[:, :, split:-1].mean(axis=1).sum(axis=0)
+        for att, value in zip(atts[:split], head_vals):
+            self.__dict__[att] += value
+        for att, value in zip(atts[split:-1], tail_vals):
+            self.__dict__[att] += value
+        self.weight += blocks[:, :, -1].sum()
+        # scale the branch-specific parameters by the number of wired groups
+        for att in scaled:
+            self.__dict__[att] /= groups
         # calculate stack maximum energy, weight and capacitance independently of configuration
         # ToDo: Value of parameter seems unreasonable. Why does this value divided by 16 lead to the "correct" one?
-        self.capacitance = self.cap_max * 60**2 / self.volt_max * 4.67  # cell capacitance [F]
+        self.capacitance = self.cap_max * CAPACITANCE_FACTOR / self.volt_max  # cell capacitance [F]
         # ToDo: This (weight) is valid for Tesla Model S battery (P85). How to generalize?
         # self.weight += 4  # Increase stack weight by 4 kg to account for external pars (like wiring, bms, ...)
         self.cap_max_0 = self.cap_max
         # set stack cycle attributes to value of last cell in list. ToDo: What if stack is composed of some older cells?
-        self.cycle = cell.cycle
-        self.cycle_pre = cell.cycle_pre
+        self.cycle = cells[-1].cycle
+        self.cycle_pre = cells[-1].cycle_pre
 
     def propagate_attributes(self, attributes=None, electric: bool = False):
         """
@@ -195,27 +171,29 @@ class Stack(Cell):
         if attributes is None:
             attributes = []
         if electric:
-            # apply wiring logic to electrical parameter
-            for cell in self.cells:
-                cell.current = self.current / self.config_num_p
-                cell.discharge_current_max = self.discharge_current_max / self.config_num_p
-                cell.cap = self.cap / self.config_num_p
-                cell.cap_max = self.cap_max / self.config_num_p
-
-                cell.volt = self.volt / self.config_num_s
-                cell.volt_min = self.volt_min / self.config_num_s
-                cell.volt_max = self.volt_max / self.config_num_s
-                cell.discharge_volt_slope_lin = self.discharge_volt_slope_lin / self.config_num_s
-                cell.discharge_volt_slope_nonlin = self.discharge_volt_slope_nonlin / self.config_num_s
-
-                # remove weight of externals
-                # cell.weight = (self.weight - 4) / (self.config_num_s * self.config_num_p)
-                cell.temp = self.temp
-                cell.calc_state_of_charge()
+            # apply wiring logic to electrical parameter, computed once with the cached inverse factors instead of
+            # dividing per cell
+            inv_s = self._inv_s
+            inv_p = self._inv_p
+            # remove weight of externals
+            # "weight": (self.weight - 4) / (num_s * num_p)
+            broadcast_attributes(
+                self.cells,
+                {
+                    "current": self.current * inv_p,
+                    "discharge_current_max": self.discharge_current_max * inv_p,
+                    "cap": self.cap * inv_p,
+                    "cap_max": self.cap_max * inv_p,
+                    "volt": self.volt * inv_s,
+                    "volt_min": self.volt_min * inv_s,
+                    "volt_max": self.volt_max * inv_s,
+                    "discharge_volt_slope_lin": self.discharge_volt_slope_lin * inv_s,
+                    "discharge_volt_slope_nonlin": self.discharge_volt_slope_nonlin * inv_s,
+                    "temp": self.temp,
+                },
+            )
+            calc_state_of_charge_batch(self.cells)
             add_noise(["volt", "cap", "temp", "weight"], self.cells)  # adds small noise to cell values
         else:
-            # non electrical parameter
-            for att in attributes:
-                stack_att = self.__dict__[att]
-                for c in self.cells:
-                    c.__dict__[att] = stack_att
+            # non electrical parameter, assigned to all cells in one bulk store per cell
+            broadcast_attributes(self.cells, {att: self.__dict__[att] for att in attributes})
@@ -12,7 +12,7 @@
 # If not, see <https://www.gnu.org/licenses/>.
 # ======================================================================================================================
 import numpy as np
-from typing import List
+from typing import Dict, List
 from numpy.random import default_rng
 from config.constants import SEED
 
@@ -20,7 +20,62 @@ from config.constants import SEED
 rand = default_rng(seed=SEED)
 
 
-def add_noise(param_list: List, objs: List, mean: float = 0.0, stdd: float = None, stdd_range: float = 0.01):
+def gather_attributes(objs: List, attributes: List) -> Dict:
+    """
+    Collects the given attributes of a component population (cells, stacks) into a structure-of-arrays dict of
+    contiguous float arrays, one per attribute. This turns traversals of many Python objects into single NumPy
+    operations for the vectorized aggregation and degradation paths.
+
+    :param objs: Components (Battery, Stack or Cell) providing the values.
+    :type objs: list
+    :param attributes: Names of the attributes to collect.
+    :type attributes: list
+    :return: Structure-of-arrays dict mapping attribute name to array of shape (len(objs),).
+    :rtype: dict
+    """
+
+    count = len(objs)
+    return {att: np.fromiter((o.__dict__[att] for o in objs), dtype=float, count=count) for att in attributes}
+
+
+def broadcast_attributes(objs: List, values: Dict):
+    """
+    Assigns the same scalar values to every component of a population in one C-level dict update per object. This
+    replaces per-attribute Python stores in the propagation loops with a single bulk update call for all attributes.
+
+    :param objs: Components (Battery, Stack or Cell) to be updated.
+    :type objs: list
+    :param values: Mapping of attribute name to the shared value all components should receive.
+    :type values: dict
+    """
+
+    for obj in objs:
+        obj.__dict__.update(values)
+
+
+def scatter_attributes(objs: List, arrays: Dict):
+    """
+    Writes structure-of-arrays values back onto the component population, the inverse of gather_attributes.
+
+    :param objs: Components (Battery, Stack or Cell) to be updated.
+    :type objs: list
+    :param arrays: Structure-of-arrays dict mapping attribute name to array of shape (len(objs),).
+    :type arrays: dict
+    """
+
+    for att, values in arrays.items():
+        for obj, value in zip(objs, values.tolist()):
+            obj.__dict__[att] = value
+
+
+def add_noise(
+    param_list: List,
+    objs: List,
+    mean: float = 0.0,
+    stdd: float = None,
+    stdd_range: float = 0.01,
+    _standard_normal=rand.standard_normal,
+):
     """
     Adds noise to desired parameter to mimic realistic behavior of measurements.
 
@@ -34,14 +89,22 @@ def add_noise(param_list: List, objs: List, mean: float = 0.0, stdd: float = Non
     :type stdd: float
     :param stdd_range: Adjust stdd to a small range of the calculated mean (~1 %). Only used if stdd = None.
     :type stdd_range: float
+    :param _standard_normal: Draw function of the shared generator, bound at definition time so the per-call lookup
+                             is a local load; also allows injecting a different generator.
     """
 
     num_values = len(objs)
-    for param in param_list:
-        if stdd is None:
-            stdd = np.mean([o.__dict__[param] for o in objs]) / 2 * stdd_range
-        noise = rand.normal(mean, stdd, num_values)
-        # center values around zero additionally to mean==0, to reduce discretization error
-        noise -= np.mean(noise)
-        for i in range(num_values):
-            objs[i].__dict__[param] += noise[i]
+    values_by_param = gather_attributes(objs, param_list)
+    # one batched draw covers all parameters, amortizing the generator call; the rows are centered around zero to
+    # reduce discretization error (which also cancels the mean argument, as the per-parameter centering did before)
+    noise = _standard_normal((len(param_list), num_values))
+    noise += mean
+    noise -= noise.mean(axis=1, keepdims=True)
+    for param, noise_row in zip(param_list, noise):
+        values = values_by_param[param]
+        # derive the deviation from this parameter's own mean; assigning to stdd here would cache the first
+        # parameter's deviation and leak it onto every following parameter
+        stdd_param = values.mean() / 2 * stdd_range if stdd is None else stdd
+        # scale the centered row and add the noise in place on the gathered array, then write back in bulk
+        values += stdd_param * noise_row
+        scatter_attributes(objs, {param: values})